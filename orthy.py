@@ -2,10 +2,17 @@ import sys
 import math
 import io
 import os
+import re
 import threading
+import time
+import multiprocessing
+import concurrent.futures
+from multiprocessing import shared_memory
+from collections import OrderedDict, namedtuple
 import tkinter as tk
 from tkinter import filedialog, colorchooser, simpledialog, messagebox, font as tkfont
-from PIL import Image, ImageTk, ImageFont, ImageDraw
+from PIL import Image, ImageTk, ImageFont, ImageDraw, ImageFilter
+import numpy as np  # For vector geometry
 import cairosvg  # For SVG support
 from pynput import keyboard, mouse  # For global keyboard events
 import logging   # For logging
@@ -50,9 +57,18 @@ class ImageState:
     and visibility settings.
     """
 
-    def __init__(self, image_original, name, svg_content=None):
-        self.image_original = image_original
+    def __init__(self, image_original, name, svg_content=None, filepath=None):
+        # Decoded original. Hidden layers may release it under memory pressure;
+        # it is then re-created from the SVG text or the file on next use
+        self.loaded_original = image_original
+        self.original_size = image_original.size
+        self.original_lock = threading.Lock()
+        self.filepath = filepath
+        self.file_mtime = self.get_file_mtime(filepath)
         self.image_display = None
+        self.display_raster = None  # Last rendered raster, shown through image_display or the composite
+        self.display_photo_source = None  # Raster image_display was created from
+        self.display_origin = (0, 0)  # Top-left of display_raster relative to its center
         self.name = name
         self.visible = True
 
@@ -71,8 +87,2130 @@ class ImageState:
         # Transparency
         self.image_transparency_level = 0.2  # Set to minimum transparency by default
 
-        # SVG content
+        # Power-of-two downscales of the original, built on demand when zoomed out
+        self.mipmaps = MipmapPyramid(image_original, lambda: self.image_original)
+
+        # Low resolution alpha mask for hit-testing, built on demand
+        self.hit_mask = None
+
+        # SVG content, re-rasterized at the displayed scale when zoomed in
+        self.svg_content = svg_content
+        self.svg_rasters = SvgRasterCache(svg_content, image_original.size) if svg_content else None
+
+        # Stroked outlines of the SVG for vector rendering, parsed on first use (False if unsupported)
+        self.vector_geometry = None
+        self.vector_box = None  # Screen box of the last drawn outlines
+
+        # Cached output of each render pipeline stage
+        self.render_cache = StageCache()
+
+        # Finished rasters of recently shown transforms, so stepping back is instant
+        self.raster_cache = RasterCache()
+
+        # Background render bookkeeping: last submitted and last shown job
+        self.render_generation = 0
+        self.shown_generation = 0
+        self.pending_render_key = None
+
+        # Time of the last draw, so the memory budget can release the least recently used layers first
+        self.last_used = 0.0
+
+    @property
+    def image_original(self):
+        """
+        The full resolution RGBA original, decoded again if it was released.
+        """
+        with self.original_lock:
+            if self.loaded_original is None:
+                self.loaded_original = self.load_original()
+            return self.loaded_original
+
+    def get_vector_geometry(self):
+        """
+        Returns the SvgGeometry of an SVG image, or None if it is not an SVG or
+        cannot be drawn as vectors.
+        """
+        if self.svg_content is None:
+            return None
+        if self.vector_geometry is None:
+            self.vector_geometry = SvgGeometry.parse(self.svg_content, self.original_size) or False
+            if self.vector_geometry:
+                logging.info(f"Parsed {len(self.vector_geometry.outlines)} outlines of image '{self.name}'.")
+        return self.vector_geometry or None
+
+    @property
+    def can_release_original(self):
+        """
+        True if the original can be re-created from the SVG text, or from a file
+        that is still on disk unchanged since the image was loaded.
+        """
+        if self.svg_content is not None:
+            return True
+        return self.filepath is not None and self.is_file_unchanged()
+
+    def is_file_unchanged(self):
+        """
+        True if the file the image was loaded from still exists with the recorded modification time.
+        """
+        mtime = self.get_file_mtime(self.filepath)
+        return mtime is not None and mtime == self.file_mtime
+
+    @staticmethod
+    def get_file_mtime(filepath):
+        """
+        Returns the modification time of a file, or None if it is unknown.
+        """
+        try:
+            return os.path.getmtime(filepath) if filepath else None
+        except OSError:
+            return None
+
+    def load_original(self):
+        """
+        Re-creates the original from the SVG text, or from the file it was loaded from.
+        """
+        if self.svg_content is not None:
+            png_data = cairosvg.svg2png(bytestring=self.svg_content.encode('utf-8'))
+            image = Image.open(io.BytesIO(png_data)).convert("RGBA")
+        elif not self.is_file_unchanged():
+            # Never substitute a different picture; the layer stays empty instead of retrying on every draw
+            logging.error(
+                f"'{self.filepath}' was changed, moved or deleted since image '{self.name}' was loaded; "
+                f"the image cannot be shown. Load it again."
+            )
+            self.filepath = None
+            return Image.new('RGBA', self.original_size)
+        else:
+            image = Image.open(self.filepath).convert("RGBA")
+
+        # Every cache and hit test assumes the size the image was loaded with
+        if image.size != self.original_size:
+            image = image.resize(self.original_size, Image.LANCZOS)
+        logging.info(f"Original of image '{self.name}' re-created.")
+        return image
+
+    def release_original(self):
+        """
+        Drops the original and every raster derived from it, if it can be re-created.
+        """
+        if not self.can_release_original:
+            return False
+        self.release_caches()
+        self.mipmaps.release()
+        with self.original_lock:
+            self.loaded_original = None
+        return True
+
+    def release_caches(self):
+        """
+        Drops every raster derived from image_original. They are rebuilt on
+        demand the next time the image is drawn.
+        """
+        del self.mipmaps.levels[1:]
+        if self.svg_rasters is not None:
+            self.svg_rasters.clear()
+        self.render_cache.clear()
+        self.raster_cache.clear()
+        self.hit_mask = None
+        if self.vector_geometry:
+            self.vector_geometry.flattened.clear()
+        self.display_raster = None
+        self.display_photo_source = None
+        self.image_display = None
+
+class MipmapPyramid:
+    """
+    Lazily populated power-of-two pyramid of an image. Level n is the image
+    halved n times, so zoomed-out rendering resamples from a raster close to
+    the output size instead of the full resolution original.
+    """
+
+    def __init__(self, image, load):
+        self.levels = [image]
+        self.load = load  # Returns the base image again after release()
+
+    def release(self):
+        """
+        Drops every level, including the base image.
+        """
+        self.levels.clear()
+
+    def get_level(self, scale):
+        """
+        Returns (raster, level_scale) for the smallest level that is still at
+        or above the scale, building the missing levels on the way.
+        """
+        if not self.levels:
+            self.levels.append(self.load())
+        base = self.levels[0]
+        if scale >= 1.0:
+            return base, 1.0
+
+        level = int(math.floor(-math.log2(scale) + 1e-9))
+        while len(self.levels) <= level:
+            previous = self.levels[-1]
+            if min(previous.size) < 2:
+                break
+            self.levels.append(previous.resize((previous.width // 2, previous.height // 2), Image.BOX))
+
+        raster = self.levels[min(level, len(self.levels) - 1)]
+        return raster, raster.width / base.width
+
+class SvgRasterCache:
+    """
+    Re-rasterizes an SVG image at quantized scale buckets and keeps the most
+    recently used rasters in a small LRU, so zooming in stays sharp without
+    upscaling the native raster.
+    """
+
+    BUCKETS_PER_OCTAVE = 2  # Bucket scales are powers of sqrt(2)
+    MAX_SIDE = 4096  # Largest raster side in pixels
+
+    # Buckets larger than MAX_SIDE (zoomed-in rulers) are rasterized in tiles on demand instead
+    TILED_MAX_SIDE = 16384  # Largest side of the tiled raster, which is never allocated whole
+    TILE_SIZE = 512  # Tile side in pixels
+
+    def __init__(self, svg_content, base_size, max_entries=4, max_tiles=64):
         self.svg_content = svg_content
+        self.base_size = base_size
+        self.max_entries = max_entries
+        self.rasters = OrderedDict()
+
+        # Tiles are keyed by (bucket, column, row)
+        self.max_tiles = max_tiles
+        self.tiles = OrderedDict()
+        self.tile_lock = threading.Lock()
+        self.tile_root = None
+        self.view_box = None
+        self.view_box_loaded = False
+
+    def can_tile(self):
+        """
+        Returns True if the SVG can be rasterized in tiles, parsing its root on
+        first use. SVGs without a viewBox are not tiled.
+        """
+        with self.tile_lock:
+            if not self.view_box_loaded:
+                self.load_view_box()
+                self.view_box_loaded = True
+        return self.view_box is not None
+
+    def is_tiled(self, bucket):
+        """
+        Returns True if a bucket is rasterized in tiles: its raster would exceed MAX_SIDE.
+        """
+        return max(self.get_size(bucket)) > self.MAX_SIDE
+
+    def load_view_box(self):
+        """
+        Parses the SVG root once for tiling.
+        """
+        try:
+            parser = etree.XMLParser(ns_clean=True, recover=True, encoding='utf-8', huge_tree=True)
+            root = etree.fromstring(self.svg_content.encode('utf-8'), parser=parser)
+            view_box = [float(v) for v in root.get('viewBox', '').replace(',', ' ').split()]
+            if len(view_box) == 4 and view_box[2] > 0 and view_box[3] > 0:
+                self.tile_root = root
+                self.view_box = tuple(view_box)
+        except Exception as e:
+            logging.error(f"Error parsing SVG for tiling: {e}")
+
+    def get_bucket(self, scale):
+        """
+        Returns the smallest bucket at or above the scale, capped at MAX_SIDE,
+        or at TILED_MAX_SIDE for SVGs that can be tiled. Scales up to 1 use the
+        native raster (bucket 1).
+        """
+        if scale <= 1.0:
+            return 1.0
+        steps = math.ceil(math.log2(scale) * self.BUCKETS_PER_OCTAVE - 1e-9)
+        bucket = 2 ** (steps / self.BUCKETS_PER_OCTAVE)
+        max_side = self.MAX_SIDE
+        if max(self.base_size) * bucket > self.MAX_SIDE and self.can_tile():
+            max_side = self.TILED_MAX_SIDE
+        return max(1.0, min(bucket, max_side / max(self.base_size)))
+
+    def get_size(self, bucket):
+        """
+        Returns the pixel size of the SVG rasterized at a bucket.
+        """
+        return round(self.base_size[0] * bucket), round(self.base_size[1] * bucket)
+
+    def peek(self, bucket):
+        """
+        Returns the raster for a bucket if it is cached, without rasterizing.
+        """
+        return self.rasters.get(bucket)
+
+    def get(self, bucket):
+        """
+        Returns the raster for a bucket, rasterizing it on a cache miss.
+        """
+        raster = self.rasters.get(bucket)
+        if raster is not None:
+            self.rasters.move_to_end(bucket)
+            return raster
+
+        raster = self.rasterize(bucket)
+        self.rasters[bucket] = raster
+        while len(self.rasters) > self.max_entries:
+            self.rasters.popitem(last=False)
+        return raster
+
+    def rasterize(self, bucket):
+        """
+        Renders the SVG at the given multiple of its native size.
+        """
+        width, height = self.get_size(bucket)
+        png_data = cairosvg.svg2png(
+            bytestring=self.svg_content.encode('utf-8'), output_width=width, output_height=height
+        )
+        logging.info(f"SVG rasterized at {width}x{height} (scale bucket {bucket:.3f}).")
+        return Image.open(io.BytesIO(png_data)).convert("RGBA")
+
+    def clear(self):
+        """
+        Drops all cached rasters and tiles.
+        """
+        self.rasters.clear()
+        with self.tile_lock:
+            self.tiles.clear()
+
+    def get_tile(self, bucket, column, row):
+        """
+        Returns one tile of the SVG at a bucket, rasterizing it on a cache miss.
+        """
+        key = (bucket, column, row)
+        with self.tile_lock:
+            tile = self.tiles.get(key)
+            if tile is not None:
+                self.tiles.move_to_end(key)
+                return tile
+
+        tile = self.rasterize_tile(bucket, column, row)
+        with self.tile_lock:
+            self.tiles[key] = tile
+            while len(self.tiles) > self.max_tiles:
+                self.tiles.popitem(last=False)
+        return tile
+
+    def rasterize_tile(self, bucket, column, row):
+        """
+        Renders one tile by pointing the SVG viewBox at the tile's part of the drawing.
+        """
+        width, height = self.get_size(bucket)
+        left, top = column * self.TILE_SIZE, row * self.TILE_SIZE
+        tile_width = min(self.TILE_SIZE, width - left)
+        tile_height = min(self.TILE_SIZE, height - top)
+        view_x, view_y, view_width, view_height = self.view_box
+        units_x, units_y = view_width / width, view_height / height
+
+        with self.tile_lock:
+            self.tile_root.set('viewBox', (
+                f"{view_x + left * units_x} {view_y + top * units_y} "
+                f"{tile_width * units_x} {tile_height * units_y}"
+            ))
+            self.tile_root.set('preserveAspectRatio', 'none')
+            svg_data = etree.tostring(self.tile_root)
+
+        png_data = cairosvg.svg2png(bytestring=svg_data, output_width=tile_width, output_height=tile_height)
+        logging.debug(f"SVG tile ({column}, {row}) rasterized at scale bucket {bucket:.3f}.")
+        return Image.open(io.BytesIO(png_data)).convert("RGBA")
+
+class SvgTileSource:
+    """
+    Stands in for the full raster of a tiled SVG at one scale bucket. Only the
+    tiles a cropped region overlaps are rasterized, through the tile cache of
+    the SvgRasterCache, so zoomed-in rulers never allocate the whole raster.
+    """
+
+    def __init__(self, svg_rasters, bucket):
+        self.svg_rasters = svg_rasters
+        self.bucket = bucket
+        self.width, self.height = svg_rasters.get_size(bucket)
+
+    @property
+    def size(self):
+        return (self.width, self.height)
+
+    def crop(self, box):
+        """
+        Assembles the region (left, top, right, bottom) from its tiles.
+        """
+        left, top, right, bottom = box
+        tile_size = self.svg_rasters.TILE_SIZE
+        region = Image.new('RGBA', (right - left, bottom - top))
+        for row in range(top // tile_size, (bottom - 1) // tile_size + 1):
+            for column in range(left // tile_size, (right - 1) // tile_size + 1):
+                tile = self.svg_rasters.get_tile(self.bucket, column, row)
+                region.paste(tile, (column * tile_size - left, row * tile_size - top))
+        return region
+
+class SvgGeometry:
+    """
+    Stroked outlines of an SVG for vector rendering. Every path, line, polyline,
+    polygon and rect is parsed once with lxml into subpaths of line and cubic
+    Bezier segments, in the pixel space of the rasterized SVG (the space of
+    image_original). Curves are flattened on demand to a screen-space
+    tolerance, so outlines stay smooth when zoomed in and cheap when zoomed
+    out; the point arrays are cached per outline and tolerance bucket. SVGs
+    with content that cannot be drawn as strokes, such as embedded images or
+    text, are not supported.
+    """
+
+    SHAPES = {'path', 'line', 'polyline', 'polygon', 'rect'}
+    UNSUPPORTED = {'image', 'use', 'text', 'foreignObject'}
+    SKIPPED = {'defs', 'clipPath', 'mask', 'symbol', 'marker', 'pattern', 'metadata', 'title', 'desc', 'style'}
+    TOLERANCE = 0.25  # Largest distance of a flattened outline from its curve, in screen pixels
+    MIN_BUCKET = -12  # Tolerance buckets are powers of two of raster pixels, clamped to this range
+    MAX_BUCKET = 4
+    MAX_STEPS = 256  # Line segments per curve at most
+
+    PATH_TOKEN = re.compile(r'[MmZzLlHhVvCcSsQqTtAa]|[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?')
+    TRANSFORM = re.compile(r'(matrix|translate|scale|rotate|skewX|skewY)\s*\(([^)]*)\)')
+    COLOR = re.compile(r'^(#[0-9a-fA-F]{3,12}|[a-zA-Z ]+)$')
+    RGB_COLOR = re.compile(r'^rgb\(\s*([^,\s]+)\s*,\s*([^,\s]+)\s*,\s*([^,\s)]+)\s*\)$')
+    NUMBER = re.compile(r'[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?')
+
+    def __init__(self, strokes):
+        # strokes holds (subpaths, color, width) per shape; a subpath is a list of
+        # segments, each a tuple of 2 (line) or 4 (cubic) points. Every subpath
+        # becomes one outline: a (K, 4, 2) array of cubics, lines included
+        self.outlines = [
+            (self.get_cubics(subpath), color, width)
+            for subpaths, color, width in strokes for subpath in subpaths
+        ]
+        self.flattened = PathCache()
+
+    @classmethod
+    def parse(cls, svg_content, size):
+        """
+        Returns the geometry of an SVG rasterized at size, or None if it
+        contains anything that cannot be drawn as strokes.
+        """
+        try:
+            parser = etree.XMLParser(ns_clean=True, recover=True, encoding='utf-8', huge_tree=True)
+            root = etree.fromstring(svg_content.encode('utf-8'), parser=parser)
+        except Exception as e:
+            logging.error(f"Error parsing SVG geometry: {e}")
+            return None
+
+        # Map the viewBox (or the user space) onto the raster
+        view_box = [float(v) for v in cls.NUMBER.findall(root.get('viewBox', ''))]
+        if len(view_box) == 4 and view_box[2] > 0 and view_box[3] > 0:
+            view_x, view_y, view_width, view_height = view_box
+        else:
+            view_x = view_y = 0.0
+            view_width = cls.get_length(root.get('width')) or size[0]
+            view_height = cls.get_length(root.get('height')) or size[1]
+        scale_x, scale_y = size[0] / view_width, size[1] / view_height
+        matrix = (scale_x, 0.0, -view_x * scale_x, 0.0, scale_y, -view_y * scale_y)
+
+        strokes = []
+        if not cls.collect(root, matrix, {'stroke': 'none', 'stroke-width': '1'}, strokes):
+            return None
+        return cls(strokes)
+
+    @classmethod
+    def collect(cls, element, matrix, inherited, strokes):
+        """
+        Walks an element and its children, appending the stroked shapes.
+        Returns False if an unsupported element is found, or anything the canvas
+        lines cannot show: a filled shape, or partial opacity.
+        """
+        tag = etree.QName(element).localname if isinstance(element.tag, str) else None
+        if tag is None or tag in cls.SKIPPED:
+            return True
+        if tag in cls.UNSUPPORTED:
+            logging.info(f"SVG contains <{tag}>, vector rendering is not available.")
+            return False
+
+        style = dict(inherited)
+        for name in ('stroke', 'stroke-width', 'stroke-opacity', 'fill', 'fill-opacity', 'display', 'visibility'):
+            if element.get(name) is not None:
+                style[name] = element.get(name)
+        for declaration in (element.get('style') or '').split(';'):
+            if ':' in declaration:
+                name, value = declaration.split(':', 1)
+                style[name.strip()] = value.strip()
+        if style.get('display') == 'none':
+            return True
+        # Group and element opacity compound, so any partial opacity rules the mode out
+        opacity = element.get('opacity') or cls.get_declaration(element, 'opacity')
+        if opacity is not None and cls.get_length(opacity) < 1:
+            logging.info(f"SVG contains <{tag}> with opacity {opacity}, vector rendering is not available.")
+            return False
+        if element.get('transform'):
+            matrix = cls.multiply(matrix, cls.parse_transform(element.get('transform')))
+
+        if tag in cls.SHAPES and style.get('visibility') != 'hidden':
+            # Lines have no interior, every other shape is filled black unless told otherwise
+            fill = style.get('fill', 'black')
+            if tag != 'line' and fill != 'none' and cls.get_length(style.get('fill-opacity', '1')) > 0:
+                logging.info(f"SVG contains a filled <{tag}>, vector rendering is not available.")
+                return False
+            stroke = style.get('stroke', 'none')
+            if stroke != 'none' and cls.get_length(style.get('stroke-opacity', '1')) < 1:
+                logging.info(f"SVG contains a translucent <{tag}> stroke, vector rendering is not available.")
+                return False
+            if stroke != 'none':
+                stroke = cls.get_color(stroke)
+                subpaths = [
+                    [tuple(cls.apply(matrix, point) for point in segment) for segment in subpath]
+                    for subpath in cls.get_subpaths(tag, element) if subpath
+                ]
+                # Stroke widths scale with the transform
+                width = cls.get_length(style.get('stroke-width')) * math.sqrt(abs(matrix[0] * matrix[4] - matrix[1] * matrix[3]))
+                if subpaths:
+                    strokes.append((subpaths, stroke, width))
+        for child in element:
+            if not cls.collect(child, matrix, style, strokes):
+                return False
+        return True
+
+    @classmethod
+    def get_color(cls, value):
+        """
+        Returns an SVG color in a form Tk accepts: named and hex colors as they
+        are, rgb(r, g, b) and rgb(r%, g%, b%) as #rrggbb, anything else as black.
+        """
+        value = value.strip()
+        if cls.COLOR.match(value):
+            return value
+        match = cls.RGB_COLOR.match(value)
+        if match:
+            try:
+                channels = [
+                    float(part[:-1]) * 2.55 if part.endswith('%') else float(part)
+                    for part in match.groups()
+                ]
+                return '#' + ''.join(f"{max(0, min(255, round(channel))):02x}" for channel in channels)
+            except ValueError:
+                pass
+        logging.debug(f"SVG color '{value}' is not supported, drawing it black.")
+        return 'black'
+
+    @staticmethod
+    def get_declaration(element, name):
+        """
+        Returns the value of a declaration in an element's style attribute, or None.
+        """
+        for declaration in (element.get('style') or '').split(';'):
+            if ':' in declaration and declaration.split(':', 1)[0].strip() == name:
+                return declaration.split(':', 1)[1].strip()
+        return None
+
+    @classmethod
+    def get_subpaths(cls, tag, element):
+        """
+        Returns the subpaths of a shape element in its own coordinates.
+        """
+        if tag == 'path':
+            return cls.parse_path(element.get('d', ''))
+        if tag == 'line':
+            start = (cls.get_length(element.get('x1')), cls.get_length(element.get('y1')))
+            end = (cls.get_length(element.get('x2')), cls.get_length(element.get('y2')))
+            return [[(start, end)]]
+        if tag == 'rect':
+            x, y = cls.get_length(element.get('x')), cls.get_length(element.get('y'))
+            width, height = cls.get_length(element.get('width')), cls.get_length(element.get('height'))
+            corners = [(x, y), (x + width, y), (x + width, y + height), (x, y + height), (x, y)]
+            return [list(zip(corners, corners[1:]))]
+        values = [float(v) for v in cls.NUMBER.findall(element.get('points', ''))]
+        points = list(zip(values[0::2], values[1::2]))
+        if tag == 'polygon' and points:
+            points.append(points[0])
+        return [list(zip(points, points[1:]))]
+
+    @classmethod
+    def parse_path(cls, data):
+        """
+        Parses SVG path data into subpaths of line and cubic segments. Quadratic
+        curves are raised to cubics; elliptical arcs are replaced by a line to their end point.
+        """
+        tokens = cls.PATH_TOKEN.findall(data)
+        subpaths = []
+        segments = None
+        current = start = (0.0, 0.0)
+        control = None  # Last cubic or quadratic control point, for S and T
+        command = None
+        index = 0
+
+        def numbers(count):
+            nonlocal index
+            values = [float(token) for token in tokens[index:index + count]]
+            index += count
+            return values
+
+        while index < len(tokens):
+            if tokens[index].isalpha():
+                command = tokens[index]
+                index += 1
+            elif command is None:
+                break
+            relative = command.islower()
+            upper = command.upper()
+            base = current if relative else (0.0, 0.0)
+
+            if upper == 'Z':
+                if segments is not None and current != start:
+                    segments.append((current, start))
+                current, control = start, None
+                # Z takes no arguments; a following number repeats nothing
+                command = None
+                continue
+
+            arity = {'M': 2, 'L': 2, 'H': 1, 'V': 1, 'C': 6, 'S': 4, 'Q': 4, 'T': 2, 'A': 7}[upper]
+            if index + arity > len(tokens) or any(token.isalpha() for token in tokens[index:index + arity]):
+                break
+            values = numbers(arity)
+
+            if upper == 'M':
+                current = start = (base[0] + values[0], base[1] + values[1])
+                segments = []
+                subpaths.append(segments)
+                control = None
+                # Further coordinate pairs are implicit line-tos
+                command = 'l' if relative else 'L'
+                continue
+            if segments is None:
+                segments = []
+                subpaths.append(segments)
+
+            if upper in ('L', 'H', 'V', 'A'):
+                if upper == 'H':
+                    end = (base[0] + values[0], current[1])
+                elif upper == 'V':
+                    end = (current[0], base[1] + values[0])
+                else:
+                    end = (base[0] + values[-2], base[1] + values[-1])
+                segments.append((current, end))
+                control = None
+            elif upper in ('C', 'S'):
+                if upper == 'C':
+                    first = (base[0] + values[0], base[1] + values[1])
+                    values = values[2:]
+                else:
+                    first = (2 * current[0] - control[0], 2 * current[1] - control[1]) if control else current
+                second = (base[0] + values[0], base[1] + values[1])
+                end = (base[0] + values[2], base[1] + values[3])
+                segments.append((current, first, second, end))
+                control = second
+            else:
+                if upper == 'Q':
+                    quad = (base[0] + values[0], base[1] + values[1])
+                    end = (base[0] + values[2], base[1] + values[3])
+                else:
+                    quad = (2 * current[0] - control[0], 2 * current[1] - control[1]) if control else current
+                    end = (base[0] + values[0], base[1] + values[1])
+                segments.append((
+                    current,
+                    (current[0] + 2 / 3 * (quad[0] - current[0]), current[1] + 2 / 3 * (quad[1] - current[1])),
+                    (end[0] + 2 / 3 * (quad[0] - end[0]), end[1] + 2 / 3 * (quad[1] - end[1])),
+                    end
+                ))
+                # The reflected point for a following T is the quadratic control point
+                control = quad
+            current = end
+        return subpaths
+
+    @staticmethod
+    def get_cubics(subpath):
+        """
+        Returns the segments of a subpath as a (K, 4, 2) array of cubic control
+        points. Lines get their control points at thirds, which makes them
+        straight cubics that flatten to a single segment.
+        """
+        cubics = []
+        for segment in subpath:
+            if len(segment) == 2:
+                (x0, y0), (x1, y1) = segment
+                segment = (
+                    (x0, y0), (x0 + (x1 - x0) / 3, y0 + (y1 - y0) / 3),
+                    (x0 + 2 * (x1 - x0) / 3, y0 + 2 * (y1 - y0) / 3), (x1, y1)
+                )
+            cubics.append(segment)
+        return np.array(cubics, dtype=np.float64).reshape(-1, 4, 2)
+
+    @classmethod
+    def get_bucket(cls, scale):
+        """
+        Returns the tolerance bucket for drawing at scale screen pixels per raster
+        pixel: the exponent of the largest power of two tolerance (in raster
+        pixels) that stays within TOLERANCE on screen.
+        """
+        tolerance = cls.TOLERANCE / max(scale, 1e-9)
+        return max(cls.MIN_BUCKET, min(cls.MAX_BUCKET, math.floor(math.log2(tolerance))))
+
+    @classmethod
+    def flatten(cls, cubics, tolerance):
+        """
+        Flattens a (K, 4, 2) array of cubics into an (N, 2) float32 polyline
+        within tolerance. Each curve is split into n equal steps with n from
+        the bound on its second derivative, 0.75 * L / n^2 <= tolerance, where
+        L is the largest second difference of its control points.
+        """
+        p0, p1, p2, p3 = cubics[:, 0], cubics[:, 1], cubics[:, 2], cubics[:, 3]
+        second = np.maximum(
+            np.hypot(*(p0 - 2 * p1 + p2).T), np.hypot(*(p1 - 2 * p2 + p3).T)
+        )
+        steps = np.clip(np.ceil(np.sqrt(0.75 * second / tolerance)), 1, cls.MAX_STEPS).astype(np.int64)
+
+        # Parameters (0, 1] of every step of every curve, evaluated in one go
+        curve = np.repeat(np.arange(len(cubics)), steps)
+        first_step = np.cumsum(steps) - steps
+        t = ((np.arange(len(curve)) - first_step[curve] + 1) / steps[curve])[:, None]
+        inverse = 1.0 - t
+        points = (
+            inverse ** 3 * p0[curve] + 3 * inverse ** 2 * t * p1[curve]
+            + 3 * inverse * t ** 2 * p2[curve] + t ** 3 * p3[curve]
+        )
+        return np.concatenate([p0[:1], points]).astype(np.float32)
+
+    def get_outline(self, index, bucket):
+        """
+        Returns outline index flattened to the tolerance of a bucket, from the cache if possible.
+        """
+        key = (index, bucket)
+        points = self.flattened.get(key)
+        if points is None:
+            points = self.flattened.put(key, self.flatten(self.outlines[index][0], 2.0 ** bucket))
+        return points
+
+    def get_polylines(self, scale):
+        """
+        Returns (points, color, width) for every outline, flattened for drawing
+        at scale screen pixels per raster pixel.
+        """
+        bucket = self.get_bucket(scale)
+        return [
+            (self.get_outline(index, bucket), color, width)
+            for index, (_, color, width) in enumerate(self.outlines)
+        ]
+
+    def hit_test(self, point, tolerance, scale):
+        """
+        Returns True if a raster point lies within tolerance raster pixels of
+        any stroke, with the outlines flattened as for drawing at scale.
+        """
+        x, y = point
+        for points, _, width in self.get_polylines(scale):
+            start, end = points[:-1].astype(np.float64), points[1:].astype(np.float64)
+            if len(start) == 0:
+                start = end = points.astype(np.float64)
+            direction = end - start
+            length_squared = np.maximum((direction ** 2).sum(axis=1), 1e-12)
+            t = np.clip(((x - start[:, 0]) * direction[:, 0] + (y - start[:, 1]) * direction[:, 1]) / length_squared, 0, 1)
+            distance = np.hypot(start[:, 0] + t * direction[:, 0] - x, start[:, 1] + t * direction[:, 1] - y)
+            if distance.min() <= tolerance + width / 2:
+                return True
+        return False
+
+    @classmethod
+    def parse_transform(cls, text):
+        """
+        Parses an SVG transform attribute into a matrix in TransformEngine layout.
+        """
+        matrix = (1.0, 0.0, 0.0, 0.0, 1.0, 0.0)
+        for name, arguments in cls.TRANSFORM.findall(text):
+            values = [float(v) for v in cls.NUMBER.findall(arguments)]
+            if name == 'matrix' and len(values) == 6:
+                step = (values[0], values[2], values[4], values[1], values[3], values[5])
+            elif name == 'translate' and values:
+                step = (1.0, 0.0, values[0], 0.0, 1.0, values[1] if len(values) > 1 else 0.0)
+            elif name == 'scale' and values:
+                step = (values[0], 0.0, 0.0, 0.0, values[1] if len(values) > 1 else values[0], 0.0)
+            elif name == 'rotate' and values:
+                radians = math.radians(values[0])
+                cos_a, sin_a = math.cos(radians), math.sin(radians)
+                cx, cy = (values[1], values[2]) if len(values) == 3 else (0.0, 0.0)
+                step = (cos_a, -sin_a, cx - cos_a * cx + sin_a * cy, sin_a, cos_a, cy - sin_a * cx - cos_a * cy)
+            elif name == 'skewX' and values:
+                step = (1.0, math.tan(math.radians(values[0])), 0.0, 0.0, 1.0, 0.0)
+            elif name == 'skewY' and values:
+                step = (1.0, 0.0, 0.0, math.tan(math.radians(values[0])), 1.0, 0.0)
+            else:
+                continue
+            matrix = cls.multiply(matrix, step)
+        return matrix
+
+    @staticmethod
+    def multiply(outer, inner):
+        """
+        Returns the matrix that applies inner first, then outer.
+        """
+        a, b, c, d, e, f = outer
+        g, h, i, j, k, l = inner
+        return (a * g + b * j, a * h + b * k, a * i + b * l + c, d * g + e * j, d * h + e * k, d * i + e * l + f)
+
+    @staticmethod
+    def apply(matrix, point):
+        """
+        Maps a point through a matrix.
+        """
+        a, b, c, d, e, f = matrix
+        return (a * point[0] + b * point[1] + c, d * point[0] + e * point[1] + f)
+
+    @classmethod
+    def get_length(cls, value):
+        """
+        Returns the number in an SVG length ('0.2px', '12'), or 0 if there is none.
+        """
+        match = cls.NUMBER.search(value or '')
+        return float(match.group()) if match else 0.0
+
+class PathCache:
+    """
+    Bounded LRU of flattened outlines, keyed by (outline index, tolerance
+    bucket). Points are kept as float32 arrays; entries are evicted oldest
+    first once their total size exceeds max_bytes.
+    """
+
+    DEFAULT_MAX_BYTES = 8 * 1024 * 1024
+
+    def __init__(self, max_bytes=None):
+        self.max_bytes = self.DEFAULT_MAX_BYTES if max_bytes is None else max_bytes
+        self.entries = OrderedDict()  # Key -> points
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """
+        Returns the cached points for a key, or None.
+        """
+        points = self.entries.get(key)
+        if points is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return points
+
+    def put(self, key, points):
+        """
+        Stores a point array, evicts past max_bytes and returns the array.
+        """
+        old = self.entries.pop(key, None)
+        if old is not None:
+            self.total_bytes -= old.nbytes
+        if points.nbytes > self.max_bytes:
+            return points
+
+        self.entries[key] = points
+        self.total_bytes += points.nbytes
+        while self.total_bytes > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.total_bytes -= evicted.nbytes
+        return points
+
+    def clear(self):
+        """
+        Drops all flattened outlines.
+        """
+        self.entries.clear()
+        self.total_bytes = 0
+
+class OpacityCache:
+    """
+    Applies opacity levels to RGBA rasters with a precomputed lookup table,
+    so the alpha scaling is a single vectorized Image.point pass. Results are
+    kept per (raster, level) in a small LRU, which makes toggling or animating
+    between levels a cache lookup. Each result records the layer it belongs
+    to, so the memory budget can count and release it.
+    """
+
+    def __init__(self, max_entries=8):
+        self.max_entries = max_entries
+        self.tables = {}
+        self.results = OrderedDict()
+        self.lock = threading.Lock()  # Render threads share the cache
+
+    def get_table(self, level):
+        """
+        Returns the point() table for a level: identity for RGB, scaled alpha.
+        """
+        table = self.tables.get(level)
+        if table is None:
+            table = self.tables[level] = list(range(256)) * 3 + [int(p * level) for p in range(256)]
+        return table
+
+    def apply(self, raster, level, owner=None):
+        """
+        Returns the raster with its alpha channel multiplied by the level.
+        owner is the name of the layer the raster belongs to.
+        """
+        if level >= 1.0:
+            return raster
+
+        key = (id(raster), level)
+        with self.lock:
+            entry = self.results.get(key)
+            if entry is not None and entry[0] is raster:
+                self.results.move_to_end(key)
+                return entry[1]
+            table = self.get_table(level)
+
+        result = raster.point(table)
+        with self.lock:
+            # Keep the source raster referenced so its id stays unique while cached
+            self.results[key] = (raster, result, owner)
+            while len(self.results) > self.max_entries:
+                self.results.popitem(last=False)
+        return result
+
+    def get_usage(self):
+        """
+        Returns the bytes pinned per layer name by cached sources and results.
+        """
+        usage = {}
+        with self.lock:
+            for raster, result, owner in self.results.values():
+                usage[owner] = (
+                    usage.get(owner, 0) + MemoryBudget.get_raster_bytes(raster) + MemoryBudget.get_raster_bytes(result)
+                )
+        return usage
+
+    def release_layer(self, name):
+        """
+        Drops the cached results of a layer.
+        """
+        with self.lock:
+            for key in [key for key, entry in self.results.items() if entry[2] == name]:
+                del self.results[key]
+
+# Immutable copy of the ImageState fields a render depends on. The field names
+# match ImageState, so TransformEngine accepts a snapshot in its place.
+RenderSnapshot = namedtuple('RenderSnapshot', [
+    'scale', 'angle', 'is_flipped_horizontally', 'is_flipped_vertically', 'image_transparency_level'
+])
+
+class RenderWorker:
+    """
+    Renders layer rasters on background threads so slow resamples never block
+    the Tk loop. Only the newest waiting job per layer is kept, and a layer is
+    never rendered by two threads at once; finished results are handed back to
+    the Tk thread with widget.after.
+    """
+
+    def __init__(self, widget, threads=1):
+        self.widget = widget
+        self.jobs = OrderedDict()  # Layer name -> (generation, render, deliver)
+        self.active = set()  # Layers being rendered right now
+        self.condition = threading.Condition()
+        self.running = True
+        self.threads = [
+            threading.Thread(target=self.run, name=f"RenderWorker-{index}", daemon=True)
+            for index in range(threads)
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    def submit(self, name, generation, render, deliver):
+        """
+        Queues render() for a layer, replacing a job for the same layer that has
+        not started yet. deliver(generation, result) is called on the Tk thread.
+        """
+        with self.condition:
+            if name in self.jobs:
+                logging.debug(f"Render job for image '{name}' replaced by newer state.")
+            self.jobs[name] = (generation, render, deliver)
+            self.condition.notify()
+
+    def take_job(self):
+        """
+        Removes and returns the oldest job of a layer that is not being rendered, or None.
+        """
+        for name in self.jobs:
+            if name not in self.active:
+                self.active.add(name)
+                return name, self.jobs.pop(name)
+        return None
+
+    def run(self):
+        """
+        Worker loop: takes the oldest waiting job, renders it and hands the result back.
+        """
+        while True:
+            with self.condition:
+                job = None
+                while self.running and job is None:
+                    job = self.take_job()
+                    if job is None:
+                        self.condition.wait()
+                if not self.running:
+                    return
+                name, (generation, render, deliver) = job
+
+            try:
+                result = render()
+            except Exception as e:
+                logging.error(f"Error rendering image '{name}': {e}")
+                result = None
+            finally:
+                with self.condition:
+                    self.active.discard(name)
+                    # A newer job for this layer may be waiting for it
+                    self.condition.notify_all()
+
+            try:
+                self.widget.after(0, deliver, generation, result)
+            except (RuntimeError, tk.TclError):
+                # The Tk main loop has ended or the root was destroyed
+                return
+
+    def stop(self):
+        """
+        Stops the worker thread after the job in progress.
+        """
+        with self.condition:
+            self.running = False
+            self.jobs.clear()
+            self.condition.notify_all()
+
+class SharedRasterMemory(shared_memory.SharedMemory):
+    """
+    Shared memory block that is not closed when the object is collected. Its
+    mapping then lives exactly as long as the buffers exported from it, so a
+    raster wrapped with Image.frombuffer can outlive the block object.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # The mapping holds its own handle; on POSIX the block's descriptor
+        # would otherwise stay open for as long as the process runs
+        if getattr(self, '_fd', -1) >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+    def __del__(self):
+        pass
+
+def render_in_process(source_name, source_size, output_name, snapshot, resample, source_scale, clip):
+    """
+    Worker process side of ProcessRenderer: transforms the shared source raster
+    and writes the result into the shared output block. Returns the origin.
+    """
+    source_memory = shared_memory.SharedMemory(name=source_name)
+    output_memory = shared_memory.SharedMemory(name=output_name)
+    source = raster = None
+    try:
+        source = Image.frombuffer('RGBA', source_size, source_memory.buf, 'raw', 'RGBA', 0, 1)
+        raster, origin = TransformEngine().render(source, snapshot, resample, source_scale, clip)
+        data = raster.tobytes()
+        output_memory.buf[:len(data)] = data
+        return origin
+    finally:
+        # Release the buffer before the block is closed; an identity transform
+        # returns the source itself, so the result holds it as well
+        source = raster = None
+        source_memory.close()
+        output_memory.close()
+
+class ProcessRenderer:
+    """
+    Runs TransformEngine.render in a pool of worker processes, so visible layers
+    resample on separate cores instead of sharing the GIL. Each source raster is
+    copied once into shared memory and reused by later jobs. The output block is
+    allocated by the main process and wrapped with Image.frombuffer, so the
+    result is never copied back.
+    """
+
+    def __init__(self, processes=None, max_sources=16):
+        self.processes = processes or os.cpu_count() or 1
+        self.pool = concurrent.futures.ProcessPoolExecutor(max_workers=self.processes)
+        self.max_sources = max_sources
+        self.sources = OrderedDict()  # id(raster) -> (raster, SharedMemory, layer name)
+        self.lock = threading.Lock()
+
+    def can_render(self, source):
+        """
+        Returns True for sources the worker processes can read: whole RGBA rasters.
+        """
+        return isinstance(source, Image.Image) and source.mode == 'RGBA'
+
+    def share_source(self, raster, owner=None):
+        """
+        Returns the shared memory block holding a source raster of the layer
+        owner, copying it in on first use.
+        """
+        key = id(raster)
+        with self.lock:
+            entry = self.sources.get(key)
+            if entry is not None and entry[0] is raster:
+                self.sources.move_to_end(key)
+                return entry[1]
+
+            data = raster.tobytes()
+            memory = shared_memory.SharedMemory(create=True, size=len(data))
+            memory.buf[:len(data)] = data
+            # Keep the raster referenced so its id stays unique while shared
+            self.sources[key] = (raster, memory, owner)
+            while len(self.sources) > self.max_sources:
+                _, (_, evicted, _) = self.sources.popitem(last=False)
+                self.release(evicted)
+            return memory
+
+    def get_usage(self):
+        """
+        Returns the bytes pinned per layer name: each shared source counts its
+        raster and its shared memory block.
+        """
+        usage = {}
+        with self.lock:
+            for raster, memory, owner in self.sources.values():
+                usage[owner] = usage.get(owner, 0) + MemoryBudget.get_raster_bytes(raster) + memory.size
+        return usage
+
+    def release_layer(self, name):
+        """
+        Frees the shared sources of a layer.
+        """
+        with self.lock:
+            for key in [key for key, entry in self.sources.items() if entry[2] == name]:
+                self.release(self.sources.pop(key)[1])
+
+    def render(self, engine, source, snapshot, resample, source_scale, clip, owner=None):
+        """
+        Renders like TransformEngine.render, in a worker process. Blocks the
+        calling render thread, not the Tk loop, until the result is ready.
+        """
+        source_memory = self.share_source(source, owner)
+        linear = engine.get_linear(snapshot, snapshot.scale / source_scale)
+        _, _, width, height = engine.get_output_rect(linear, source.size, clip)
+        output_memory = SharedRasterMemory(create=True, size=width * height * 4)
+        try:
+            origin = self.pool.submit(
+                render_in_process, source_memory.name, source.size, output_memory.name,
+                snapshot, resample, source_scale, clip
+            ).result()
+            raster = Image.frombuffer('RGBA', (width, height), output_memory.buf, 'raw', 'RGBA', 0, 1)
+        except Exception:
+            self.release(output_memory)
+            raise
+
+        # The mapping stays valid after unlink; the block is freed with the raster
+        try:
+            output_memory.unlink()
+        except FileNotFoundError:
+            pass
+        return raster, origin
+
+    @staticmethod
+    def release(memory):
+        """
+        Closes and removes a shared memory block.
+        """
+        try:
+            memory.close()
+            memory.unlink()
+        except (BufferError, FileNotFoundError) as e:
+            logging.debug(f"Shared memory block {memory.name} not released: {e}")
+
+    def stop(self):
+        """
+        Shuts the worker processes down and frees the shared sources.
+        """
+        self.pool.shutdown(wait=False, cancel_futures=True)
+        with self.lock:
+            for _, memory, _ in self.sources.values():
+                self.release(memory)
+            self.sources.clear()
+
+class StageCache:
+    """
+    Memoizes the output of each stage of the render pipeline. Every stage keeps
+    only its last result, keyed by the parameters that stage depends on.
+    """
+
+    def __init__(self):
+        self.stages = {}
+
+    def get(self, stage, key):
+        """
+        Returns the cached result of a stage, or None if its key has changed.
+        """
+        entry = self.stages.get(stage)
+        if entry is not None and entry[0] == key:
+            return entry[1]
+        return None
+
+    def put(self, stage, key, value):
+        """
+        Stores the result of a stage and returns it.
+        """
+        self.stages[stage] = (key, value)
+        return value
+
+    def clear(self):
+        """
+        Drops all cached stage results.
+        """
+        self.stages.clear()
+
+class RasterCache:
+    """
+    Bounded LRU of finished rasters, keyed by the quantized transform of an image.
+    Stepping back to a recent scale, angle, flip or opacity is then a lookup
+    instead of a re-render. Entries are evicted oldest first once their total
+    size exceeds max_bytes.
+    """
+
+    DEFAULT_MAX_BYTES = 48 * 1024 * 1024
+    SCALE_DIGITS = 4  # Scales are keyed to 1e-4
+    ANGLE_DIGITS = 2  # Angles are keyed to 1/100 of a degree
+
+    def __init__(self, max_bytes=None):
+        self.max_bytes = self.DEFAULT_MAX_BYTES if max_bytes is None else max_bytes
+        self.entries = OrderedDict()  # Key -> ((raster, origin), size in bytes)
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def quantize(cls, snapshot):
+        """
+        Rounds a RenderSnapshot so that repeated steps which should cancel out
+        (+0.5 then -0.5 degrees) land on the same key despite float drift.
+        """
+        return snapshot._replace(
+            scale=round(snapshot.scale, cls.SCALE_DIGITS),
+            angle=round(snapshot.angle, cls.ANGLE_DIGITS) % 360,
+            image_transparency_level=round(snapshot.image_transparency_level, 2)
+        )
+
+    def get(self, key):
+        """
+        Returns the cached (raster, origin) for a key, or None.
+        """
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, key, value):
+        """
+        Stores a (raster, origin) pair, evicts past max_bytes and returns the pair.
+        """
+        raster = value[0]
+        size = raster.width * raster.height * len(raster.getbands())
+        old = self.entries.pop(key, None)
+        if old is not None:
+            self.total_bytes -= old[1]
+        if size > self.max_bytes:
+            return value
+
+        self.entries[key] = (value, size)
+        self.total_bytes += size
+        while self.total_bytes > self.max_bytes:
+            _, (_, evicted_size) = self.entries.popitem(last=False)
+            self.total_bytes -= evicted_size
+        return value
+
+    def clear(self):
+        """
+        Drops all cached rasters.
+        """
+        self.entries.clear()
+        self.total_bytes = 0
+
+class TransformEngine:
+    """
+    Composes the scale, flips and rotation of an ImageState into a single affine
+    matrix and renders the transformed raster from it.
+
+    Matrices are 6-tuples (a, b, c, d, e, f) mapping a point (u, v) to
+    (a * u + b * v + c, d * u + e * v + f), the same layout Image.AFFINE uses.
+    """
+
+    # Filters Image.transform supports; anything else (LANCZOS) is applied by a resize pass
+    AFFINE_FILTERS = (Image.NEAREST, Image.BILINEAR, Image.BICUBIC)
+
+    # Padding around the visible area and the grid it is snapped to, in canvas pixels
+    CLIP_MARGIN = 256
+    CLIP_GRID = 256
+
+    def __init__(self, resample=Image.LANCZOS):
+        self.resample = resample
+
+    @staticmethod
+    def get_linear(image_state, scale=None):
+        """
+        Returns the 2x2 part (a, b, d, e) of the transform: scale, then flips,
+        then rotation. PIL angles are counterclockwise and the canvas y axis points down.
+        The scale defaults to the image's own scale.
+        """
+        if scale is None:
+            scale = image_state.scale
+        radians = math.radians(image_state.angle)
+        cos_a = math.cos(radians)
+        sin_a = math.sin(radians)
+        fx = -scale if image_state.is_flipped_horizontally else scale
+        fy = -scale if image_state.is_flipped_vertically else scale
+        return (cos_a * fx, sin_a * fy, -sin_a * fx, cos_a * fy)
+
+    @staticmethod
+    def get_center(image_state):
+        """
+        Returns the canvas position of the center of the transformed image.
+        The offset is always the on-screen center; rotate() keeps it there.
+        """
+        return image_state.offset_x, image_state.offset_y
+
+    @staticmethod
+    def rotate(image_state, angle_increment):
+        """
+        Rotates an image by angle_increment degrees. Rotating around the rotation
+        point is the same as rotating around the image center and moving the
+        center around the rotation point by the same angle.
+        """
+        image_state.angle = (image_state.angle + angle_increment) % 360
+        if not image_state.rotation_point:
+            return
+
+        pivot_x, pivot_y = image_state.rotation_point
+        dx = image_state.offset_x - pivot_x
+        dy = image_state.offset_y - pivot_y
+        radians = math.radians(angle_increment)
+        cos_a = math.cos(radians)
+        sin_a = math.sin(radians)
+        image_state.offset_x = pivot_x + dx * cos_a + dy * sin_a
+        image_state.offset_y = pivot_y - dx * sin_a + dy * cos_a
+
+    @classmethod
+    def get_matrix(cls, image_state, size):
+        """
+        Returns the full matrix mapping source pixels of the given size to canvas coordinates.
+        """
+        a, b, d, e = cls.get_linear(image_state)
+        center_x, center_y = cls.get_center(image_state)
+        half_w, half_h = size[0] / 2, size[1] / 2
+        return (
+            a, b, center_x - a * half_w - b * half_h,
+            d, e, center_y - d * half_w - e * half_h
+        )
+
+    @classmethod
+    def map_to_source(cls, image_state, size, point):
+        """
+        Maps a canvas point back to source pixel coordinates of an image of the given size.
+        """
+        a, b, d, e = cls.get_linear(image_state)
+        ia, ib, id_, ie = cls.invert_linear((a, b, d, e))
+        center_x, center_y = cls.get_center(image_state)
+        dx, dy = point[0] - center_x, point[1] - center_y
+        return (ia * dx + ib * dy + size[0] / 2, id_ * dx + ie * dy + size[1] / 2)
+
+    @classmethod
+    def get_extent(cls, image_state, size):
+        """
+        Returns the half width and half height of the axis-aligned box around the transformed image.
+        """
+        a, b, d, e = cls.get_linear(image_state)
+        return (
+            (abs(a) * size[0] + abs(b) * size[1]) / 2,
+            (abs(d) * size[0] + abs(e) * size[1]) / 2
+        )
+
+    @classmethod
+    def get_clip(cls, image_state, size, viewport):
+        """
+        Returns the part of the transformed image that needs rendering, as
+        (left, top, right, bottom) relative to get_center, or None when the
+        whole image fits in the viewport (width, height). The visible area is
+        padded by CLIP_MARGIN and snapped to CLIP_GRID, so small moves keep
+        the same clip and can reuse the cached raster.
+        """
+        center_x, center_y = cls.get_center(image_state)
+        half_w, half_h = cls.get_extent(image_state, size)
+        view_w, view_h = viewport
+        if (center_x - half_w >= 0 and center_y - half_h >= 0 and
+                center_x + half_w <= view_w and center_y + half_h <= view_h):
+            return None
+
+        margin, grid = cls.CLIP_MARGIN, cls.CLIP_GRID
+        left = max(-half_w, math.floor((-center_x - margin) / grid) * grid)
+        top = max(-half_h, math.floor((-center_y - margin) / grid) * grid)
+        right = min(half_w, math.ceil((view_w - center_x + margin) / grid) * grid)
+        bottom = min(half_h, math.ceil((view_h - center_y + margin) / grid) * grid)
+        # Keep at least one pixel when the image is entirely off-screen
+        return (left, top, max(right, left + 1), max(bottom, top + 1))
+
+    def render(self, image, image_state, resample=None, source_scale=1.0, clip=None):
+        """
+        Transforms an image and returns (raster, (left, top)), where (left, top)
+        is the position of the raster's top-left corner relative to get_center.
+        source_scale is the size of the given image relative to image_original,
+        for sources that were rasterized larger than native. With a clip from
+        get_clip, only the source region that lands inside it is resampled, so
+        memory is bounded by the viewport instead of the zoom level.
+
+        With an Image.transform filter the result is produced in a single pass.
+        LANCZOS, or a strong downscale that a point-sampling transform would alias,
+        first resizes the image and then applies the flips and rotation in a second pass.
+        """
+        if resample is None:
+            resample = self.resample
+        scale = image_state.scale / source_scale
+        a, b, d, e = self.get_linear(image_state, scale)
+        full_width, full_height = image.width, image.height
+        source_x, source_y = full_width / 2, full_height / 2
+        box = (0, 0, full_width, full_height)
+
+        left, top, width, height = self.get_output_rect((a, b, d, e), image.size, clip)
+        if clip is not None:
+            # Limit the source to what maps into the clip, plus room for the filter
+            box = self.get_source_box((a, b, d, e), (left, top, left + width, top + height), (source_x, source_y))
+            margin = math.ceil(3 / min(scale, 1.0)) + 1
+            box = (
+                max(0, math.floor(box[0]) - margin), max(0, math.floor(box[1]) - margin),
+                min(full_width, math.ceil(box[2]) + margin), min(full_height, math.ceil(box[3]) + margin)
+            )
+            if box[2] <= box[0] or box[3] <= box[1]:
+                return Image.new('RGBA', (width, height)), (left, top)
+
+        # A tiled source only assembles the region under the box, with room for
+        # the grid alignment and filter support of the resize below; origin is
+        # that region's place in the source
+        origin_x = origin_y = 0
+        if isinstance(image, SvgTileSource):
+            margin = math.ceil(4 / min(scale, 1.0)) + 1
+            origin_x = max(0, math.floor(box[0]) - margin)
+            origin_y = max(0, math.floor(box[1]) - margin)
+            image = image.crop((
+                origin_x, origin_y,
+                min(full_width, math.ceil(box[2]) + margin), min(full_height, math.ceil(box[3]) + margin)
+            ))
+
+        if resample not in self.AFFINE_FILTERS or scale < 0.5:
+            # Resize only the source box, aligned to the pixel grid of the whole
+            # resized image so clipped and unclipped frames sample the same points
+            x0 = math.floor(box[0] * scale) / scale
+            y0 = math.floor(box[1] * scale) / scale
+            new_w = max(1, round((box[2] - x0) * scale))
+            new_h = max(1, round((box[3] - y0) * scale))
+            box = (x0, y0, min(full_width, x0 + new_w / scale), min(full_height, y0 + new_h / scale))
+            scale_x, scale_y = new_w / (box[2] - box[0]), new_h / (box[3] - box[1])
+            image = image.resize(
+                (new_w, new_h), resample,
+                box=(box[0] - origin_x, box[1] - origin_y, box[2] - origin_x, box[3] - origin_y)
+            )
+            source_x, source_y = (source_x - box[0]) * scale_x, (source_y - box[1]) * scale_y
+            origin_x = origin_y = 0
+            a, b, d, e = (a / scale_x, b / scale_y, d / scale_x, e / scale_y)
+            if resample not in self.AFFINE_FILTERS:
+                resample = Image.BICUBIC
+
+        if clip is None and image_state.angle % 360 == 0 and image.size == (width, height):
+            # Nothing left but flips: at most one transpose
+            if a < 0 and e < 0:
+                image = image.transpose(Image.ROTATE_180)
+            elif a < 0:
+                image = image.transpose(Image.FLIP_LEFT_RIGHT)
+            elif e < 0:
+                image = image.transpose(Image.FLIP_TOP_BOTTOM)
+            return image, (left, top)
+
+        # Invert the linear part to map output pixels back to source pixels
+        ia, ib, id_, ie = self.invert_linear((a, b, d, e))
+        data = (
+            ia, ib, ia * left + ib * top + source_x - origin_x,
+            id_, ie, id_ * left + ie * top + source_y - origin_y
+        )
+        return image.transform((width, height), Image.AFFINE, data, resample), (left, top)
+
+    @staticmethod
+    def get_output_rect(linear, size, clip):
+        """
+        Returns (left, top, width, height) of the raster render() produces from a
+        source of the given size, with left and top relative to get_center.
+        """
+        if clip is None:
+            a, b, d, e = linear
+            width = max(1, math.ceil(abs(a) * size[0] + abs(b) * size[1] - 1e-6))
+            height = max(1, math.ceil(abs(d) * size[0] + abs(e) * size[1] - 1e-6))
+            return -width / 2, -height / 2, width, height
+        left, top, right, bottom = clip
+        return left, top, max(1, math.ceil(right - left - 1e-6)), max(1, math.ceil(bottom - top - 1e-6))
+
+    @staticmethod
+    def invert_linear(linear):
+        """
+        Returns the inverse of a 2x2 linear part (a, b, d, e).
+        """
+        a, b, d, e = linear
+        det = a * e - b * d
+        return (e / det, -b / det, -d / det, a / det)
+
+    @classmethod
+    def get_source_box(cls, linear, rect, source_center):
+        """
+        Returns the source bounding box (x_min, y_min, x_max, y_max) of an output
+        rectangle given relative to the center of the transformed image.
+        """
+        ia, ib, id_, ie = cls.invert_linear(linear)
+        xs, ys = [], []
+        for x, y in ((rect[0], rect[1]), (rect[2], rect[1]), (rect[2], rect[3]), (rect[0], rect[3])):
+            xs.append(ia * x + ib * y + source_center[0])
+            ys.append(id_ * x + ie * y + source_center[1])
+        return (min(xs), min(ys), max(xs), max(ys))
+
+class HitTester:
+    """
+    Decides whether a canvas point lies on an image from its transform alone.
+    The point is mapped back into source coordinates, which tests against the
+    exact rotated box of the image. With use_alpha_mask, points away from the
+    image's content are rejected as well: SVGs that can be drawn as vectors are
+    tested against their flattened strokes, other images against a small
+    cached alpha mask.
+    """
+
+    MASK_SIZE = 256  # Longest side of the alpha mask in pixels
+    MASK_TOLERANCE = 3  # Dilation of the mask in mask pixels, so thin lines stay clickable
+    STROKE_TOLERANCE = 4  # Distance from an SVG stroke that still hits it, in screen pixels
+
+    def __init__(self, use_alpha_mask=False):
+        self.use_alpha_mask = use_alpha_mask
+
+    def hit_test(self, image_state, point):
+        """
+        Returns True if the canvas point is on the image.
+        """
+        width, height = image_state.original_size
+        u, v = TransformEngine.map_to_source(image_state, (width, height), point)
+        if not (0 <= u < width and 0 <= v < height):
+            return False
+        if not self.use_alpha_mask:
+            return True
+
+        geometry = image_state.get_vector_geometry()
+        if geometry is not None:
+            scale = max(image_state.scale, 1e-9)
+            return geometry.hit_test((u, v), self.STROKE_TOLERANCE / scale, scale)
+
+        mask = self.get_mask(image_state)
+        x = min(mask.width - 1, int(u * mask.width / width))
+        y = min(mask.height - 1, int(v * mask.height / height))
+        return mask.getpixel((x, y)) > 0
+
+    def get_mask(self, image_state):
+        """
+        Returns the dilated low resolution alpha mask of an image, building it on first use.
+        """
+        if image_state.hit_mask is None:
+            width, height = image_state.original_size
+            raster, _ = image_state.mipmaps.get_level(min(1.0, self.MASK_SIZE / max(width, height)))
+            ratio = min(1.0, self.MASK_SIZE / max(raster.size))
+            mask = raster.getchannel('A').resize(
+                (max(1, round(raster.width * ratio)), max(1, round(raster.height * ratio))), Image.BOX
+            )
+            image_state.hit_mask = mask.filter(ImageFilter.MaxFilter(self.MASK_TOLERANCE))
+        return image_state.hit_mask
+
+class SceneLayer:
+    """
+    Canvas items and last drawn values for one ImageState.
+    """
+
+    def __init__(self):
+        self.image_item = None
+        self.marker_item = None
+        self.photo = None
+        self.position = None
+        self.rotation_point = None
+        self.visible = False
+        self.vector_items = []
+        self.vectors_visible = False
+
+class CanvasScene:
+    """
+    Retained canvas scene: keeps one image item and one rotation point marker per
+    ImageState, plus one item for the composited frame, and only touches the
+    items whose bitmap, position or visibility changed.
+    """
+
+    MARKER_RADIUS = 1.5
+
+    # Tk lines have no alpha; opacity is approximated with stipple patterns
+    STIPPLES = ((0.875, ''), (0.625, 'gray75'), (0.375, 'gray50'), (0.19, 'gray25'), (0.0, 'gray12'))
+
+    def __init__(self, canvas):
+        self.canvas = canvas
+        self.layers = {}
+        self.frame_item = None
+        self.frame_photo = None
+        self.frame_position = (0, 0)
+        self.frame_visible = False
+
+    def get_layer(self, name):
+        """
+        Returns the record for an image, creating it on first use.
+        """
+        layer = self.layers.get(name)
+        if layer is None:
+            layer = self.layers[name] = SceneLayer()
+        return layer
+
+    def update_layer(self, name, photo, position):
+        """
+        Shows an image layer with the given bitmap at the given top-left position.
+        """
+        layer = self.get_layer(name)
+        if layer.image_item is None:
+            layer.image_item = self.canvas.create_image(position, image=photo, anchor='nw')
+            if layer.marker_item is not None:
+                self.canvas.tag_raise(layer.marker_item)
+            layer.photo, layer.position, layer.visible = photo, position, True
+            return
+        if layer.photo is not photo:
+            self.canvas.itemconfig(layer.image_item, image=photo)
+            layer.photo = photo
+        if layer.position != position:
+            self.canvas.coords(layer.image_item, *position)
+            layer.position = position
+        if not layer.visible:
+            self.canvas.itemconfig(layer.image_item, state='normal')
+            layer.visible = True
+
+    def raise_layers(self, names):
+        """
+        Stacks the image items of the given layers above everything else, in order,
+        keeping all rotation point markers on top.
+        """
+        if not names:
+            return
+        for name in names:
+            self.canvas.tag_raise(self.layers[name].image_item)
+        for layer in self.layers.values():
+            if layer.marker_item is not None:
+                self.canvas.tag_raise(layer.marker_item)
+
+    def hide_layer(self, name):
+        """
+        Hides the image item of a layer, keeping it for when it is shown again.
+        """
+        layer = self.layers.get(name)
+        if layer is None or not layer.visible:
+            return
+        self.canvas.itemconfig(layer.image_item, state='hidden')
+        layer.visible = False
+
+    def release_layer(self, name):
+        """
+        Detaches the bitmap from a layer's image item so its PhotoImage can be freed.
+        """
+        layer = self.layers.get(name)
+        if layer is None or layer.image_item is None:
+            return
+        self.canvas.itemconfig(layer.image_item, image='')
+        layer.photo = None
+
+    def update_vectors(self, name, lines, opacity=1.0):
+        """
+        Shows the outlines of a layer as line items. lines is a list of
+        (coordinates, color, width) with coordinates as a flat sequence of x, y values.
+        """
+        layer = self.get_layer(name)
+        stipple = next(pattern for threshold, pattern in self.STIPPLES if opacity >= threshold)
+        for index, (coordinates, color, width) in enumerate(lines):
+            if index < len(layer.vector_items):
+                item = layer.vector_items[index]
+                self.canvas.coords(item, *coordinates)
+                self.canvas.itemconfig(item, fill=color, width=width, stipple=stipple, state='normal')
+            else:
+                item = self.canvas.create_line(
+                    *coordinates, fill=color, width=width, stipple=stipple, capstyle='round', joinstyle='round'
+                )
+                layer.vector_items.append(item)
+                if layer.marker_item is not None:
+                    self.canvas.tag_raise(layer.marker_item)
+        # Items left over from a longer outline list
+        for item in layer.vector_items[len(lines):]:
+            self.canvas.delete(item)
+        del layer.vector_items[len(lines):]
+        layer.vectors_visible = True
+
+    def hide_vectors(self, name):
+        """
+        Hides the line items of a layer, keeping them for when it is shown again.
+        """
+        layer = self.layers.get(name)
+        if layer is None or not layer.vectors_visible:
+            return
+        for item in layer.vector_items:
+            self.canvas.itemconfig(item, state='hidden')
+        layer.vectors_visible = False
+
+    def update_marker(self, name, rotation_point):
+        """
+        Moves, shows or hides the rotation point marker of a layer.
+        """
+        layer = self.get_layer(name)
+        if layer.rotation_point == rotation_point:
+            return
+        if rotation_point:
+            radius = self.MARKER_RADIUS
+            box = (
+                rotation_point[0] - radius, rotation_point[1] - radius,
+                rotation_point[0] + radius, rotation_point[1] + radius
+            )
+            if layer.marker_item is None:
+                layer.marker_item = self.canvas.create_oval(*box, fill='red', outline='')
+            else:
+                self.canvas.coords(layer.marker_item, *box)
+                self.canvas.itemconfig(layer.marker_item, state='normal')
+        elif layer.marker_item is not None:
+            self.canvas.itemconfig(layer.marker_item, state='hidden')
+        layer.rotation_point = rotation_point
+
+    def show_frame(self, photo, position=(0, 0)):
+        """
+        Shows the composited frame with its top-left corner at position, below all markers.
+        """
+        if self.frame_item is None:
+            self.frame_item = self.canvas.create_image(position, image=photo, anchor='nw')
+            self.canvas.tag_lower(self.frame_item)
+            self.frame_position = position
+        elif self.frame_photo is not photo:
+            self.canvas.itemconfig(self.frame_item, image=photo)
+        if self.frame_position != position:
+            self.canvas.coords(self.frame_item, *position)
+            self.frame_position = position
+        if not self.frame_visible:
+            self.canvas.itemconfig(self.frame_item, state='normal')
+            self.frame_visible = True
+        self.frame_photo = photo
+
+    def hide_frame(self):
+        """
+        Hides the composited frame.
+        """
+        if self.frame_item is not None and self.frame_visible:
+            self.canvas.itemconfig(self.frame_item, state='hidden')
+            self.frame_visible = False
+
+class LayerCompositor:
+    """
+    Alpha-composites layer rasters into a single frame buffer. The composite of
+    every prefix of the layer stack is kept, so a change only re-blends the
+    changed layer and the layers above it, and only inside the dirty rectangle:
+    the union of the old and new screen boxes of every layer that changed.
+    """
+
+    def __init__(self):
+        self.size = None
+        self.layers = []
+        self.prefixes = []
+
+    def compose(self, size, layers):
+        """
+        Composites layers, a list of (name, raster, position) from bottom to top,
+        into a frame of the given size. Returns (frame, dirty), where dirty is the
+        (left, top, right, bottom) box that changed since the last call, or
+        (None, None) if nothing changed.
+        """
+        if size != self.size:
+            self.size = size
+            self.layers = []
+            self.prefixes = []
+
+        # Find the lowest layer that differs from the last composite
+        first = 0
+        while (first < len(layers) and first < len(self.layers) and
+               self.is_same_layer(layers[first], self.layers[first])):
+            first += 1
+        if first == len(layers) == len(self.layers):
+            return None, None
+
+        # The first composite covers the whole frame
+        if not self.prefixes:
+            dirty = (0, 0) + size
+        else:
+            dirty = None
+            for index in range(first, max(len(layers), len(self.layers))):
+                new = layers[index] if index < len(layers) else None
+                old = self.layers[index] if index < len(self.layers) else None
+                if new is not None and old is not None and self.is_same_layer(new, old):
+                    continue
+                for entry in (old, new):
+                    if entry is not None:
+                        dirty = self.union(dirty, self.get_box(entry, size))
+
+        self.layers = list(layers)
+        del self.prefixes[len(layers):]
+        if dirty is None:
+            # Only layers outside the frame changed; new ones leave the composite as it is
+            while len(self.prefixes) < len(layers):
+                self.prefixes.append(self.prefixes[-1].copy())
+            return (self.prefixes[-1] if self.prefixes else Image.new('RGBA', size)), None
+
+        clear = Image.new('RGBA', (dirty[2] - dirty[0], dirty[3] - dirty[1]))
+        for index in range(first, len(layers)):
+            below = self.prefixes[index - 1] if index else None
+            if index == len(self.prefixes):
+                self.prefixes.append(below.copy() if below is not None else Image.new('RGBA', size))
+            frame = self.prefixes[index]
+            frame.paste(below.crop(dirty) if below is not None else clear, dirty[:2])
+            self.composite(frame, layers[index][1], layers[index][2], dirty)
+
+        frame = self.prefixes[-1] if self.prefixes else Image.new('RGBA', size)
+        return frame, dirty
+
+    def clear(self):
+        """
+        Drops the composites; the next compose starts from scratch.
+        """
+        self.size = None
+        self.layers = []
+        self.prefixes = []
+
+    def get_usage(self):
+        """
+        Returns the bytes held by the prefix composites, which belong to no single
+        layer, under the name None.
+        """
+        return {None: sum(MemoryBudget.get_raster_bytes(prefix) for prefix in self.prefixes)}
+
+    def release_layer(self, name):
+        """
+        Forgets the last composite if it still references a layer's raster.
+        """
+        if any(layer[0] == name for layer in self.layers):
+            self.clear()
+
+    @staticmethod
+    def is_same_layer(new, old):
+        """
+        Returns True if two (name, raster, position) entries draw the same pixels.
+        """
+        return new[0] == old[0] and new[1] is old[1] and new[2] == old[2]
+
+    @staticmethod
+    def get_box(entry, size):
+        """
+        Returns the screen box of a layer entry clipped to the frame, or None if it is outside.
+        """
+        _, raster, (x, y) = entry
+        box = (max(0, x), max(0, y), min(size[0], x + raster.width), min(size[1], y + raster.height))
+        if box[2] <= box[0] or box[3] <= box[1]:
+            return None
+        return box
+
+    @staticmethod
+    def union(box, other):
+        """
+        Returns the smallest box containing both boxes; either may be None.
+        """
+        if box is None:
+            return other
+        if other is None:
+            return box
+        return (min(box[0], other[0]), min(box[1], other[1]), max(box[2], other[2]), max(box[3], other[3]))
+
+    @staticmethod
+    def composite(frame, raster, position, region):
+        """
+        Blends a raster onto the frame at a top-left position, clipped to a region of the frame.
+        """
+        x, y = position
+        dest_x, dest_y = max(region[0], x), max(region[1], y)
+        right = min(region[2], x + raster.width)
+        bottom = min(region[3], y + raster.height)
+        if right <= dest_x or bottom <= dest_y:
+            return
+        source_x, source_y = dest_x - x, dest_y - y
+        frame.alpha_composite(
+            raster, dest=(dest_x, dest_y),
+            source=(source_x, source_y, source_x + right - dest_x, source_y + bottom - dest_y)
+        )
+
+class MemoryBudget:
+    """
+    Tracks the raster memory held by every ImageState: its original, its render
+    caches and its PhotoImage. While the total is over budget_bytes, hidden layers
+    are released, least recently drawn first: their cached rasters, and their
+    original when it can be re-created. Visible layers are never touched, so
+    what is on screen can exceed the budget.
+
+    Caches shared by all layers are registered in shared_caches. Each provides
+    get_usage(), the bytes it holds per layer name (None for bytes of no single
+    layer, which count towards the total), and release_layer(name).
+    """
+
+    CHECK_INTERVAL = 1.0  # Seconds between budget checks while drawing
+
+    def __init__(self, budget_bytes=512 * 1024 * 1024):
+        self.budget_bytes = budget_bytes
+        self.last_check = 0.0
+        self.last_visible = None
+        self.shared_caches = []
+
+    @staticmethod
+    def get_raster_bytes(raster):
+        """
+        Returns the pixel memory of a PIL image or a Tk PhotoImage (32 bits per pixel).
+        """
+        if raster is None:
+            return 0
+        if isinstance(raster, Image.Image):
+            return raster.width * raster.height * len(raster.getbands())
+        return raster.width() * raster.height() * 4
+
+    def get_usage(self, image_state, shared_usages=()):
+        """
+        Returns the bytes held by an image, split into 'original', 'caches' and 'display'.
+        shared_usages are get_usage() results of the shared caches.
+        """
+        raster_bytes = self.get_raster_bytes
+        caches = sum(usage.get(image_state.name, 0) for usage in shared_usages)
+        caches += sum(raster_bytes(level) for level in image_state.mipmaps.levels[1:])
+        svg_rasters = image_state.svg_rasters
+        if svg_rasters is not None:
+            caches += sum(raster_bytes(raster) for raster in list(svg_rasters.rasters.values()))
+            caches += sum(raster_bytes(tile) for tile in list(svg_rasters.tiles.values()))
+        caches += sum(raster_bytes(value[0]) for _, value in list(image_state.render_cache.stages.values()))
+        caches += image_state.raster_cache.total_bytes + raster_bytes(image_state.hit_mask)
+        if image_state.vector_geometry:
+            caches += image_state.vector_geometry.flattened.total_bytes
+        return {
+            'original': raster_bytes(image_state.loaded_original),
+            'caches': caches,
+            'display': raster_bytes(image_state.image_display),
+        }
+
+    def check(self, images, force=False):
+        """
+        Releases hidden layers until the images fit the budget and returns their
+        names. Runs at most every CHECK_INTERVAL, unless forced or the set of
+        visible layers changed, in which case the usage is also logged.
+        """
+        visible = frozenset(name for name, image_state in images.items() if image_state.visible)
+        force = force or visible != self.last_visible
+        now = time.monotonic()
+        if not force and now - self.last_check < self.CHECK_INTERVAL:
+            return []
+        self.last_check = now
+        self.last_visible = visible
+
+        shared_usages = [cache.get_usage() for cache in self.shared_caches]
+        usages = {name: self.get_usage(image_state, shared_usages) for name, image_state in images.items()}
+        shared = sum(size for usage in shared_usages for name, size in usage.items() if name not in images)
+        total = shared + sum(sum(usage.values()) for usage in usages.values())
+        released = []
+        if total > self.budget_bytes:
+            # Layers with a render in flight are skipped, the worker may be using their caches
+            hidden = sorted(
+                (image_state for image_state in images.values()
+                 if not image_state.visible and image_state.pending_render_key is None),
+                key=lambda image_state: image_state.last_used
+            )
+            for image_state in hidden:
+                if total <= self.budget_bytes:
+                    break
+                usage = usages[image_state.name]
+                freed = usage['caches'] + usage['display']
+                if usage['original'] and image_state.release_original():
+                    freed += usage['original']
+                    usage['original'] = 0
+                elif freed:
+                    image_state.release_caches()
+                else:
+                    continue
+                for cache in self.shared_caches:
+                    cache.release_layer(image_state.name)
+                usage['caches'] = usage['display'] = 0
+                total -= freed
+                released.append(image_state.name)
+                logging.info(f"Released {freed / 2**20:.1f} MB of rasters of hidden image '{image_state.name}'.")
+
+        if force or released:
+            totals = {part: sum(usage[part] for usage in usages.values()) for part in ('original', 'caches', 'display')}
+            logging.info(
+                f"Raster memory: {total / 2**20:.1f} of {self.budget_bytes / 2**20:.0f} MB "
+                f"(originals {totals['original'] / 2**20:.1f} MB, caches {totals['caches'] / 2**20:.1f} MB, "
+                f"display {totals['display'] / 2**20:.1f} MB, shared {shared / 2**20:.1f} MB) across {len(images)} images."
+            )
+        return released
+
+class QualityGovernor:
+    """
+    Picks the filter and proxy resolution of draft frames, the ones drawn while
+    input is active, from measured frame times. After DOWNGRADE_FRAMES frames
+    in a row over budget_ms, quality steps down one level; after UPGRADE_FRAMES
+    frames well within budget it steps back up, but never above the configured
+    interactive filter. Full quality frames drawn after input stops are not
+    governed.
+    """
+
+    # (filter, proxy resolution) from best to fastest
+    LEVELS = [
+        (Image.LANCZOS, 1.0),
+        (Image.BICUBIC, 1.0),
+        (Image.BILINEAR, 1.0),
+        (Image.NEAREST, 1.0),
+        (Image.BILINEAR, 0.5),
+        (Image.NEAREST, 0.5),
+        (Image.NEAREST, 0.25),
+    ]
+    FILTER_NAMES = {
+        Image.NEAREST: 'nearest', Image.BILINEAR: 'bilinear', Image.BICUBIC: 'bicubic', Image.LANCZOS: 'lanczos'
+    }
+
+    SMOOTHING = 0.3  # Weight of the newest frame in the moving average
+    HEADROOM = 0.5  # Frames faster than this fraction of the budget count towards stepping up
+    UPGRADE_FRAMES = 30
+    DOWNGRADE_FRAMES = 3  # A single slow frame, such as a cache miss, does not lower quality
+
+    def __init__(self, budget_ms=16.0):
+        self.budget_ms = budget_ms
+        self.level = 0
+        self.ceiling = 0  # Best level allowed, from the configured interactive filter
+        self.average_ms = None
+        self.fast_frames = 0
+        self.slow_frames = 0
+        self.render_ms = 0.0  # Draft render time since the last frame, from any render thread
+        self.lock = threading.Lock()
+
+    def get_quality(self, resample):
+        """
+        Returns the (filter, proxy resolution) for draft frames, no better than
+        the interactive filter resample at full resolution.
+        """
+        self.ceiling = next(
+            (index for index, level in enumerate(self.LEVELS) if level == (resample, 1.0)), 2
+        )
+        return self.LEVELS[max(self.level, self.ceiling)]
+
+    def add_render_time(self, render_ms):
+        """
+        Adds the time a draft render took; it is counted towards the next frame.
+        """
+        with self.lock:
+            self.render_ms += render_ms
+
+    def record_frame(self, draw_ms):
+        """
+        Records a draft frame that took draw_ms on the Tk thread and adjusts the level.
+        """
+        with self.lock:
+            frame_ms = draw_ms + self.render_ms
+            self.render_ms = 0.0
+
+        if self.average_ms is None:
+            self.average_ms = frame_ms
+        else:
+            self.average_ms += self.SMOOTHING * (frame_ms - self.average_ms)
+        self.level = max(self.level, self.ceiling)
+
+        if frame_ms > self.budget_ms:
+            self.fast_frames = 0
+            self.slow_frames += 1
+            if self.slow_frames >= self.DOWNGRADE_FRAMES and self.level < len(self.LEVELS) - 1:
+                self.set_level(self.level + 1)
+            return
+        self.slow_frames = 0
+        if self.average_ms < self.budget_ms * self.HEADROOM and self.level > self.ceiling:
+            self.fast_frames += 1
+            if self.fast_frames >= self.UPGRADE_FRAMES:
+                self.set_level(self.level - 1)
+        else:
+            self.fast_frames = 0
+
+    def set_level(self, level):
+        """
+        Switches to a quality level and starts measuring it afresh.
+        """
+        logging.info(
+            f"Render quality level {level} ({self.FILTER_NAMES[self.LEVELS[level][0]]}, "
+            f"proxy {self.LEVELS[level][1]:g}) after {self.average_ms:.1f} ms frames "
+            f"(budget {self.budget_ms:g} ms)."
+        )
+        self.level = level
+        self.average_ms = None
+        self.fast_frames = 0
+        self.slow_frames = 0
+
+class RedrawScheduler:
+    """
+    Coalesces redraw requests into at most one render per display frame.
+    A request only marks the scene dirty; the render runs from the Tk event loop
+    once the current frame interval has passed.
+    """
+
+    def __init__(self, widget, render, target_fps=60):
+        self.widget = widget
+        self.render = render
+        self.target_fps = target_fps
+        self.pending = None
+        self.last_frame_time = 0.0
+
+        # While suspended (the window is hidden), requests only set the dirty flag
+        self.suspended = False
+        self.dirty = False
+
+        # Number of requests absorbed by an already scheduled frame
+        self.collapsed = 0
+        self.total_collapsed = 0
+
+    def request(self):
+        """
+        Marks the scene dirty and schedules a render if none is pending.
+        """
+        if self.suspended:
+            self.dirty = True
+            return
+        if self.pending is not None:
+            self.collapsed += 1
+            return
+        frame_interval = 1.0 / self.target_fps
+        delay = self.last_frame_time + frame_interval - time.perf_counter()
+        if delay <= 0:
+            self.pending = self.widget.after_idle(self.flush)
+        else:
+            self.pending = self.widget.after(int(delay * 1000) + 1, self.flush)
+
+    def flush(self):
+        """
+        Renders the scene now, answering every request made since the last frame.
+        """
+        if self.pending is not None:
+            self.widget.after_cancel(self.pending)
+            self.pending = None
+        self.last_frame_time = time.perf_counter()
+        self.render()
+        if self.collapsed:
+            self.total_collapsed += self.collapsed
+            logging.debug(f"Redraw collapsed {self.collapsed} requests ({self.total_collapsed} in total).")
+            self.collapsed = 0
+
+    def cancel(self):
+        """
+        Drops a scheduled render without drawing.
+        """
+        if self.pending is not None:
+            self.widget.after_cancel(self.pending)
+            self.pending = None
+
+    def suspend(self):
+        """
+        Stops rendering until resume(). A render that was scheduled is kept as the dirty flag.
+        """
+        if self.pending is not None:
+            self.dirty = True
+        self.cancel()
+        self.suspended = True
+
+    def resume(self):
+        """
+        Starts rendering again, with one up-to-date render if anything changed while suspended.
+        """
+        self.suspended = False
+        if self.dirty:
+            self.dirty = False
+            self.flush()
 
 class TextHandler(Handler):
     """
@@ -117,6 +2255,57 @@ class ImageOverlayApp:
         self.active_image_name = None  # Name of the active image
         self.previous_active_image_name = None  # To keep track of the previous active image
 
+        # Renders the scale, flip and rotation of each image, then its opacity
+        self.transform_engine = TransformEngine()
+        self.opacity_cache = OpacityCache()
+
+        # Decides whether clicks land on the active image (use_alpha_mask=True ignores transparent areas)
+        self.hit_tester = HitTester()
+
+        # Upper bound for rasters held by all images; hidden layers are released past it
+        self.memory_budget = MemoryBudget(budget_bytes=512 * 1024 * 1024)
+        self.memory_budget.shared_caches.append(self.opacity_cache)
+
+        # Best filter used while input is active, and the idle delay (ms) before a full quality frame
+        self.interactive_resample = Image.BILINEAR
+        self.refine_delay_ms = 250
+        self.is_interacting = False
+        self.refine_job = None
+
+        # Lowers the interactive filter and resolution when frames take longer than the budget (ms)
+        self.quality_governor = QualityGovernor(budget_ms=16.0)
+
+        # Render image bitmaps on a background thread
+        self.render_in_background = True
+
+        # Resample layers in worker processes, one per core (needs render_in_background)
+        self.render_in_processes = False
+
+        # Show several visible images through one composited canvas image
+        self.composite_layers = True
+
+        # Draw SVG templates as canvas lines transformed on every frame instead of
+        # resampling their bitmaps (SVGs with embedded images or text stay bitmaps)
+        self.render_vectors = False
+
+        # Shrink the image window to the visible images instead of covering the whole screen,
+        # so the OS compositor and remote desktop sessions only repaint that area
+        self.shrink_to_content = False
+        self.window_box = None  # (left, top, right, bottom) of the shrunk window in screen coordinates
+        self.window_padding = 64  # Room around the images, in pixels
+        self.window_grid = 64  # The window box snaps to this grid, so small moves keep the window
+
+        # Fingerprint of the last drawn frame and the rasters it showed (kept so their ids stay unique),
+        # so a redraw of an unchanged scene does nothing
+        self.last_fingerprint = None
+        self.last_frame_rasters = None
+
+        # While input is active, a composited layer that only moves is shown through its own canvas
+        # item, with the layers above it, so a drag moves an item instead of re-uploading the frame
+        self.last_layers = {}  # Layer name -> (raster, position) of the last composited frame
+        self.floating_layers = set()
+        self.window_size = None  # Last size from <Configure>
+
         # Mouse event variables
         self.start_x = 0
         self.start_y = 0
@@ -505,6 +2694,32 @@ class ImageOverlayApp:
         self.canvas = tk.Canvas(self.image_window, bg='grey', highlightthickness=0, borderwidth=0)
         self.canvas.pack(fill='both', expand=True)
 
+        # Canvas items are kept between redraws and updated in place
+        self.scene = CanvasScene(self.canvas)
+
+        # Several visible images are blended into one frame (set composite_layers to False to disable)
+        self.compositor = LayerCompositor()
+        self.memory_budget.shared_caches.append(self.compositor)
+        self.frame_display = None
+        self.patch_display = None  # Upload buffer for the dirty part of the frame
+
+        # Bursts of input events are rendered at most once per frame, and not at all while hidden
+        self.redraw_scheduler = RedrawScheduler(self.canvas, self.draw_images, target_fps=60)
+        if not self.image_window_visible:
+            self.redraw_scheduler.suspend()
+
+        # Slow renders run on a background thread (set render_in_background to False to render inline).
+        # In process mode there is one render thread per worker process, so layers render in parallel
+        self.process_renderer = None
+        if self.render_in_background and self.render_in_processes:
+            try:
+                self.process_renderer = ProcessRenderer()
+                self.memory_budget.shared_caches.append(self.process_renderer)
+            except Exception as e:
+                logging.error(f"Error starting render processes, rendering on a thread: {e}")
+        render_threads = self.process_renderer.processes if self.process_renderer is not None else 1
+        self.render_worker = RenderWorker(self.canvas, threads=render_threads) if self.render_in_background else None
+
         # Force update to get accurate canvas size
         self.image_window.update_idletasks()
 
@@ -535,10 +2750,18 @@ class ImageOverlayApp:
 
     def on_image_window_resize(self, event):
         """
-        Adjusts the canvas size when the image window is resized.
+        Adjusts the canvas size when the image window is resized. Moves and
+        restacking also send <Configure>, as do the window's children; those
+        are ignored, and a burst of resizes is drawn once through the scheduler.
         """
+        if event.widget is not self.image_window:
+            return
+        size = (event.width, event.height)
+        if size == self.window_size:
+            return
+        self.window_size = size
         self.canvas.config(width=event.width, height=event.height)
-        self.draw_images()
+        self.redraw_scheduler.request()
 
     ##########################################################################################################
     ###                          --- Transparency Control Methods ---                                       ###
@@ -560,7 +2783,7 @@ class ImageOverlayApp:
             active_image.image_transparency_level = 1.0
             self.btn_toggle_transparency.config(text="Min Transp")
             logging.info(f"Transparency of image '{active_image.name}' set to maximum.")
-        self.draw_images()
+        self.redraw_scheduler.request()
 
     def update_transparency_button(self):
         """
@@ -572,6 +2795,19 @@ class ImageOverlayApp:
         else:
             self.btn_toggle_transparency.config(text="Min Transp")
 
+    def adjust_transparency(self, amount):
+        """
+        Changes the opacity of the active image by the given amount, between 0.05 and 1.0.
+        """
+        active_image = self.get_active_image()
+        if not active_image:
+            return
+        level = max(0.05, min(active_image.image_transparency_level + amount, 1.0))
+        active_image.image_transparency_level = round(level, 2)
+        self.update_transparency_button()
+        logging.debug(f"Transparency of image '{active_image.name}' set to {active_image.image_transparency_level}.")
+        self.request_redraw()
+
     ##########################################################################################################
     ###                          --- Image Loading Methods ---                                              ###
     ##########################################################################################################
@@ -587,12 +2823,12 @@ class ImageOverlayApp:
         if filepath:
             image_original, svg_content = self.open_image_file(filepath)
             if image_original:
-                image_state = ImageState(image_original, image_name, svg_content=svg_content)
+                image_state = ImageState(image_original, image_name, svg_content=svg_content, filepath=filepath)
                 self.images[image_name] = image_state
                 self.active_image_name = image_name
                 self.update_active_image_menu()
                 self.active_image_var.set(image_name)
-                self.draw_images()
+                self.redraw_scheduler.request()
 
                 logging.info(f"Image '{image_name}' loaded from '{filepath}'.")
 
@@ -627,7 +2863,7 @@ class ImageOverlayApp:
         if os.path.exists(filepath):
             image_original, svg_content = self.open_image_file(filepath)
             if image_original:
-                image_state = ImageState(image_original, image_key, svg_content=svg_content)
+                image_state = ImageState(image_original, image_key, svg_content=svg_content, filepath=filepath)
                 self.images[image_key] = image_state
 
                 # Center the image
@@ -635,7 +2871,7 @@ class ImageOverlayApp:
 
                 # Do not change the active image when loading the default image
                 self.update_active_image_menu()
-                self.draw_images()
+                self.redraw_scheduler.request()
 
                 logging.info(f"Default '{image_key}' image loaded.")
 
@@ -705,7 +2941,7 @@ class ImageOverlayApp:
             else:
                 # If already loaded, make it visible without modifying its state
                 self.images[image_key].visible = True
-                self.draw_images()
+                self.redraw_scheduler.request()
 
             self.additional_images_visibility[image_key] = True
             logging.info(f"{image_key} image made visible.")
@@ -723,7 +2959,7 @@ class ImageOverlayApp:
             # Hide the image
             if image_key in self.images:
                 self.images[image_key].visible = False
-                self.draw_images()
+                self.redraw_scheduler.request()
             self.additional_images_visibility[image_key] = False
             logging.info(f"{image_key} image hidden.")
 
@@ -736,7 +2972,7 @@ class ImageOverlayApp:
                 self.active_image_var.set(self.active_image_name)
                 self.previous_active_image_name = None
                 self.toggle_control_mode(False)  # Deactivate control mode
-                self.draw_images()
+                self.redraw_scheduler.request()
 
     def center_image(self, image_key):
         """
@@ -744,8 +2980,7 @@ class ImageOverlayApp:
         """
         if image_key in self.images:
             self.image_window.update_idletasks()
-            canvas_width = self.canvas.winfo_width()
-            canvas_height = self.canvas.winfo_height()
+            canvas_width, canvas_height = self.get_viewport_size()
             image_state = self.images[image_key]
             image_state.offset_x = (canvas_width / 2) + 156  # Shift 156 pixels to the right
             image_state.offset_y = (canvas_height / 2) + 100  # Shift 100 pixels down
@@ -783,13 +3018,13 @@ class ImageOverlayApp:
                         self.images[self.active_image_name].visible = False
 
                     # Create and store the image state
-                    image_state = ImageState(image_original, image_name, svg_content=svg_content)
+                    image_state = ImageState(image_original, image_name, svg_content=svg_content, filepath=filepath)
                     self.images[image_name] = image_state
                     self.active_image_name = image_name
                     self.images[self.active_image_name].visible = True  # Ensure the new image is visible
                     self.update_active_image_menu()
                     self.active_image_var.set(image_name)
-                    self.draw_images()
+                    self.redraw_scheduler.request()
 
                     logging.info(f"User-loaded image '{image_name}' loaded from '{filepath}'.")
 
@@ -806,66 +3041,474 @@ class ImageOverlayApp:
     ###                          --- Image Drawing Methods ---                                              ###
     ##########################################################################################################
 
+    def request_redraw(self):
+        """
+        Asks for a redraw on the next frame instead of drawing right away.
+        Used by the high-frequency mouse and keyboard handlers, so frames are
+        drawn in draft quality until the input has been idle for refine_delay_ms.
+        """
+        self.is_interacting = True
+        if self.refine_job is not None:
+            self.canvas.after_cancel(self.refine_job)
+        self.refine_job = self.canvas.after(self.refine_delay_ms, self.refine_images)
+        self.redraw_scheduler.request()
+
+    def refine_images(self):
+        """
+        Ends the interaction and redraws the images in full quality.
+        """
+        self.refine_job = None
+        self.is_interacting = False
+        self.redraw_scheduler.request()
+
     def draw_images(self):
         """
-        Clears the canvas and redraws all visible images.
+        Updates the canvas items of all images, hiding the ones that are not visible.
+        With several visible images, they are composited into a single frame.
         """
-        self.canvas.delete("all")
+        # Nothing is drawn into a withdrawn window; it catches up when shown
+        if not self.image_window_visible:
+            self.redraw_scheduler.dirty = True
+            return
+
+        # An unchanged scene draws the same frame again
+        fingerprint, _ = self.get_scene_fingerprint()
+        if fingerprint == self.last_fingerprint:
+            return
+
+        start = time.perf_counter()
+        visible_count = sum(
+            1 for image_state in self.images.values()
+            if image_state.visible and self.get_vector_geometry(image_state) is None
+        )
+        layers = [] if self.composite_layers and visible_count > 1 else None
+
         for image_state in self.images.values():
+            geometry = self.get_vector_geometry(image_state) if image_state.visible else None
+            if geometry is not None:
+                self.scene.hide_layer(image_state.name)
+                self.draw_vector_image(image_state, geometry)
+                continue
+            self.scene.hide_vectors(image_state.name)
             if image_state.visible:
-                self.draw_image(image_state)
+                self.draw_image(image_state, layers)
+            else:
+                self.scene.hide_layer(image_state.name)
+                self.scene.update_marker(image_state.name, None)
+
+        # Canvas items use screen coordinates; a shrunk window only shows its part of them
+        if self.shrink_to_content:
+            frame_box = self.update_window_box()
+        else:
+            frame_box = (0, 0, self.canvas.winfo_width(), self.canvas.winfo_height())
+
+        if layers is not None:
+            float_index = self.get_float_index(layers)
+            floating = layers[float_index:]
+            layers = layers[:float_index]
+            for name, _, _ in layers:
+                self.scene.hide_layer(name)
+            for name, raster, position in floating:
+                self.show_layer(self.images[name], raster, position)
+            self.scene.raise_layers([name for name, _, _ in floating])
+        if layers:
+            left, top = frame_box[:2]
+            frame, dirty = self.compositor.compose(
+                (frame_box[2] - left, frame_box[3] - top),
+                [(name, raster, (x - left, y - top)) for name, raster, (x, y) in layers]
+            )
+            if dirty is not None:
+                self.update_frame_photo(frame, dirty)
+        if layers and self.frame_display is not None:
+            self.scene.show_frame(self.frame_display, frame_box[:2])
+        else:
+            self.scene.hide_frame()
+        if layers is None:
+            # The prefix composites are full frames; keep them only while compositing
+            self.compositor.clear()
         self.image_window.update_idletasks()
+        if self.is_interacting:
+            self.quality_governor.record_frame((time.perf_counter() - start) * 1000)
+        self.last_fingerprint, self.last_frame_rasters = self.get_scene_fingerprint()
+
+        for name in self.memory_budget.check(self.images):
+            self.scene.release_layer(name)
 
-    def draw_image(self, image_state):
+    def get_scene_fingerprint(self):
         """
-        Applies transformations to an image and draws it on the canvas.
+        Returns (fingerprint, rasters): a tuple of everything a frame depends on,
+        that is the canvas, the draw settings and, per image, its transform and
+        last rendered raster, plus those rasters. Rasters enter the fingerprint
+        by id, so the caller keeps them alive for as long as it compares against it.
         """
-        # Apply transformations
-        img = image_state.image_original.copy()
-
-        # Apply transparency
-        if image_state.image_transparency_level < 1.0:
-            alpha = img.getchannel('A')
-            alpha = alpha.point(lambda p: int(p * image_state.image_transparency_level))
-            img.putalpha(alpha)
-
-        # Resize
-        img = img.resize(
-            (int(img.width * image_state.scale), int(img.height * image_state.scale)),
-            Image.LANCZOS
+        rasters = []
+        images = []
+        for image_state in self.images.values():
+            if not image_state.visible:
+                images.append((id(image_state), False))
+                continue
+            rasters.append(image_state.display_raster)
+            images.append((
+                id(image_state), True, id(image_state.display_raster),
+                image_state.scale, image_state.angle,
+                image_state.is_flipped_horizontally, image_state.is_flipped_vertically,
+                image_state.image_transparency_level,
+                image_state.offset_x, image_state.offset_y, image_state.rotation_point
+            ))
+        fingerprint = (
+            self.canvas.winfo_width(), self.canvas.winfo_height(), self.get_viewport_size(),
+            self.is_interacting, self.quality_governor.get_quality(self.interactive_resample),
+            self.transform_engine.resample,
+            self.composite_layers, self.shrink_to_content, self.render_vectors, tuple(images)
         )
+        return fingerprint, rasters
+
+    def draw_image(self, image_state, layers=None):
+        """
+        Applies transformations to an image and updates its canvas items.
+        When a list of layers is given, the image is added to it for compositing
+        instead of being shown through its own canvas item.
+        """
+        image_state.last_used = time.monotonic()
+        rendered = self.render_image(image_state, draft=self.is_interacting)
+        if rendered is not None:
+            image_state.display_raster, image_state.display_origin = rendered
+        elif image_state.display_raster is None:
+            # The first frame is still being rendered
+            return
+        raster = image_state.display_raster
+        left, top = image_state.display_origin
+
+        # Place the image around its (possibly rotated) center
+        center_x, center_y = self.transform_engine.get_center(image_state)
+        position = (round(center_x + left), round(center_y + top))
+        self.scene.update_marker(image_state.name, image_state.rotation_point)
+
+        if layers is not None:
+            layers.append((image_state.name, raster, position))
+            return
 
-        # Apply flips
-        if image_state.is_flipped_horizontally:
-            img = img.transpose(Image.FLIP_LEFT_RIGHT)
-        if image_state.is_flipped_vertically:
-            img = img.transpose(Image.FLIP_TOP_BOTTOM)
+        self.show_layer(image_state, raster, position)
 
-        # Rotate around the rotation point if set
+    def show_layer(self, image_state, raster, position):
+        """
+        Shows a raster through the image's own canvas item at a top-left position.
+        """
+        # Only upload to Tk when the raster itself changed
+        if image_state.display_photo_source is not raster:
+            image_state.image_display = self.update_photo(image_state.image_display, raster)
+            image_state.display_photo_source = raster
+        self.scene.update_layer(image_state.name, image_state.image_display, position)
+
+    def get_float_index(self, layers):
+        """
+        Returns the index of the lowest composited layer that is shown through
+        its own canvas item instead, together with every layer above it: while
+        input is active, the lowest layer that moved without being re-rendered,
+        or that already floats. Moving it then changes item coordinates, and the
+        composite of the layers below stays as it is. Once input stops, every
+        layer is composited again. Returns len(layers) if nothing floats.
+        """
+        previous = self.last_layers
+        self.last_layers = {name: (raster, position) for name, raster, position in layers}
+        if not self.is_interacting:
+            self.floating_layers = set()
+            return len(layers)
+
+        for index, (name, raster, position) in enumerate(layers):
+            last = previous.get(name)
+            moved = last is not None and last[0] is raster and last[1] != position
+            if moved or name in self.floating_layers:
+                self.floating_layers = {entry[0] for entry in layers[index:]}
+                return index
+        return len(layers)
+
+    def get_vector_geometry(self, image_state):
+        """
+        Returns the geometry to draw an image with as vectors, or None if it is drawn as a bitmap.
+        """
+        if not self.render_vectors:
+            return None
+        return image_state.get_vector_geometry()
+
+    def draw_vector_image(self, image_state, geometry):
+        """
+        Draws an SVG image as canvas lines: its outlines, flattened for the current
+        scale, are mapped to the canvas with the image's transform matrix in one
+        NumPy operation per outline.
+        """
+        image_state.last_used = time.monotonic()
+        a, b, c, d, e, f = self.transform_engine.get_matrix(image_state, image_state.original_size)
+        linear = np.array([[a, d], [b, e]])
+        scale = math.sqrt(abs(a * e - b * d))  # Screen pixels per raster pixel
+        lines = []
+        box = None
+        for points, color, width in geometry.get_polylines(scale):
+            mapped = points @ linear + (c, f)
+            lines.append((mapped.ravel().tolist(), color, max(1, round(width * scale))))
+            low, high = mapped.min(axis=0), mapped.max(axis=0)
+            box = LayerCompositor.union(box, (
+                math.floor(low[0]) - 1, math.floor(low[1]) - 1, math.ceil(high[0]) + 1, math.ceil(high[1]) + 1
+            ))
+        image_state.vector_box = box
+        self.scene.update_vectors(image_state.name, lines, image_state.image_transparency_level)
+        self.scene.update_marker(image_state.name, image_state.rotation_point)
+
+    def get_viewport_size(self):
+        """
+        Returns the size of the area images are drawn in: the whole screen when
+        the window is shrunk to its content, otherwise the canvas.
+        """
+        if self.shrink_to_content:
+            return self.root.winfo_screenwidth(), self.root.winfo_screenheight()
+        return self.canvas.winfo_width(), self.canvas.winfo_height()
+
+    def get_display_box(self, image_state):
+        """
+        Returns the screen box (left, top, right, bottom) of an image's last
+        rendered raster and rotation point marker, or None if nothing is shown.
+        """
+        if self.get_vector_geometry(image_state) is not None:
+            box = image_state.vector_box
+        elif image_state.display_raster is None:
+            return None
+        else:
+            center_x, center_y = self.transform_engine.get_center(image_state)
+            left = round(center_x + image_state.display_origin[0])
+            top = round(center_y + image_state.display_origin[1])
+            box = (left, top, left + image_state.display_raster.width, top + image_state.display_raster.height)
         if image_state.rotation_point:
-            rotation_center = (
-                image_state.rotation_point[0] - (image_state.offset_x - img.width / 2),
-                image_state.rotation_point[1] - (image_state.offset_y - img.height / 2)
+            x, y = image_state.rotation_point
+            box = LayerCompositor.union(box, (math.floor(x) - 2, math.floor(y) - 2, math.ceil(x) + 2, math.ceil(y) + 2))
+        return box
+
+    def update_window_box(self):
+        """
+        Moves and resizes the image window to the union of the visible images,
+        padded and snapped to window_grid so small moves keep the same window,
+        and scrolls the canvas so its items stay at their screen coordinates.
+        Returns the window box.
+        """
+        box = None
+        for image_state in self.images.values():
+            if image_state.visible:
+                box = LayerCompositor.union(box, self.get_display_box(image_state))
+
+        screen_width, screen_height = self.root.winfo_screenwidth(), self.root.winfo_screenheight()
+        grid = self.window_grid
+        if box is not None:
+            box = (
+                max(0, (box[0] - self.window_padding) // grid * grid),
+                max(0, (box[1] - self.window_padding) // grid * grid),
+                min(screen_width, -(-(box[2] + self.window_padding) // grid) * grid),
+                min(screen_height, -(-(box[3] + self.window_padding) // grid) * grid)
             )
-            img = img.rotate(image_state.angle, expand=True, center=rotation_center)
-        else:
-            img = img.rotate(image_state.angle, expand=True)
+        if box is None or box[2] <= box[0] or box[3] <= box[1]:
+            box = (0, 0, 1, 1)
+
+        if box != self.window_box:
+            self.window_box = box
+            left, top, right, bottom = box
+            self.image_window.geometry(f"{right - left}x{bottom - top}+{left}+{top}")
+            self.canvas.config(scrollregion=box)
+            self.canvas.xview_moveto(0)
+            self.canvas.yview_moveto(0)
+            logging.debug(f"Image window shrunk to {right - left}x{bottom - top} at ({left}, {top}).")
+        return box
+
+    def update_frame_photo(self, frame, dirty):
+        """
+        Pushes the dirty part of the composited frame to Tk. A small dirty area
+        is uploaded on its own and copied into the frame's PhotoImage at its
+        position; a large one, or a resized frame, is pasted whole.
+        """
+        photo = self.frame_display
+        dirty_area = (dirty[2] - dirty[0]) * (dirty[3] - dirty[1])
+        if (photo is None or (photo.width(), photo.height()) != frame.size or
+                dirty_area > frame.width * frame.height // 2):
+            self.frame_display = self.update_photo(photo, frame)
+            return
 
-        image_state.image_display = ImageTk.PhotoImage(img)
+        # PhotoImage.paste always writes at (0, 0), so upload a patch and let Tk copy it in place
+        self.patch_display = self.update_photo(self.patch_display, frame.crop(dirty))
+        photo.tk.call(
+            str(photo), 'copy', str(self.patch_display),
+            '-to', dirty[0], dirty[1], '-compositingrule', 'set'
+        )
 
-        # Draw the image at the offset position
-        self.canvas.create_image(
-            image_state.offset_x, image_state.offset_y, image=image_state.image_display
+    def update_photo(self, photo, raster):
+        """
+        Returns a PhotoImage showing the raster. An existing PhotoImage of the
+        same size is updated in place with paste(); a new one is only allocated
+        when the size changed, for example after a zoom or rotation.
+        """
+        if photo is not None and (photo.width(), photo.height()) == raster.size:
+            photo.paste(raster)
+            return photo
+        return ImageTk.PhotoImage(raster)
+
+    def render_image(self, image_state, draft=False):
+        """
+        Runs the render pipeline for an image and returns the raster to display
+        together with its top-left corner relative to TransformEngine.get_center.
+        Each stage is cached, so only the stages whose parameters changed are redone,
+        and finished rasters of recent transforms are kept in the image's RasterCache.
+        The offset and rotation point are not part of any key, unless the image
+        extends past the canvas and is clipped: moving an image only moves its
+        canvas item. Opacity is applied after the transform, so changing it
+        never re-resamples the image.
+
+        A draft render uses the interactive filter and is cached separately, so the
+        last full quality frame stays available for pure moves.
+
+        With the render worker running, a cache miss queues the render and returns
+        None; the result is shown by on_render_done.
+        """
+        cache = image_state.render_cache
+        snapshot = RasterCache.quantize(RenderSnapshot(
+            image_state.scale, image_state.angle,
+            image_state.is_flipped_horizontally, image_state.is_flipped_vertically,
+            image_state.image_transparency_level
+        ))
+        clip = self.transform_engine.get_clip(
+            image_state, image_state.original_size, self.get_viewport_size()
+        )
+        output_key = snapshot + (self.transform_engine.resample, clip)
+
+        cached = image_state.raster_cache.get(output_key)
+        if cached is not None:
+            return cached
+        logging.debug(
+            f"Raster cache miss for image '{image_state.name}' "
+            f"({image_state.raster_cache.hits} hits, {image_state.raster_cache.misses} misses)."
         )
 
-        # Draw a marker at the rotation point if set
-        if image_state.rotation_point:
-            radius = 1.5  # Marker size
-            self.canvas.create_oval(
-                image_state.rotation_point[0] - radius, image_state.rotation_point[1] - radius,
-                image_state.rotation_point[0] + radius, image_state.rotation_point[1] + radius,
-                fill='red', outline=''
+        stage_prefix = ''
+        resample = self.transform_engine.resample
+        proxy = 1.0
+        if draft:
+            stage_prefix = 'draft_'
+            resample, proxy = self.quality_governor.get_quality(self.interactive_resample)
+            output_key = snapshot + (resample, clip, proxy)
+            cached = cache.get('draft_output', output_key)
+            if cached is not None:
+                return cached
+
+        if self.render_worker is None:
+            return self.store_output(
+                image_state, stage_prefix, output_key,
+                self.render_raster(image_state, snapshot, resample, stage_prefix, clip, proxy)
+            )
+
+        # Render in the background, unless this exact frame is already on its way
+        if image_state.pending_render_key != (stage_prefix, output_key):
+            image_state.pending_render_key = (stage_prefix, output_key)
+            image_state.render_generation += 1
+            self.render_worker.submit(
+                image_state.name,
+                image_state.render_generation,
+                lambda: self.render_raster(image_state, snapshot, resample, stage_prefix, clip, proxy),
+                lambda generation, result: self.on_render_done(
+                    image_state, generation, stage_prefix, output_key, result
+                )
+            )
+        return None
+
+    def render_raster(self, image_state, snapshot, resample, stage_prefix='', clip=None, proxy=1.0):
+        """
+        Produces the transformed and opacity-adjusted raster for a snapshot of an
+        image's state, limited to the clip from TransformEngine.get_clip.
+        A proxy below 1 renders at that fraction of the scale and enlarges the
+        result, for drafts on slow machines.
+        Touches no Tk objects, so it can run on the render worker.
+        """
+        cache = image_state.render_cache
+        start = time.perf_counter()
+        if proxy < 1.0:
+            snapshot = snapshot._replace(scale=snapshot.scale * proxy)
+            if clip is not None:
+                clip = tuple(value * proxy for value in clip)
+
+        # Pick the source raster: SVGs are re-rasterized near the displayed scale
+        source, source_scale = self.get_source_image(image_state, snapshot.scale, draft=bool(stage_prefix))
+
+        # Scale, flip and rotate in one go
+        source_key = snapshot[:4] + (resample, source_scale, clip)
+        transformed = cache.get(stage_prefix + 'transform', source_key)
+        if transformed is None:
+            if self.process_renderer is not None and self.process_renderer.can_render(source):
+                transformed = self.process_renderer.render(
+                    self.transform_engine, source, snapshot, resample, source_scale, clip, image_state.name
+                )
+            else:
+                transformed = self.transform_engine.render(source, snapshot, resample, source_scale, clip)
+            cache.put(stage_prefix + 'transform', source_key, transformed)
+
+        raster, origin = transformed
+        if proxy < 1.0:
+            raster = raster.resize(
+                (max(1, round(raster.width / proxy)), max(1, round(raster.height / proxy))), Image.NEAREST
             )
+            origin = (origin[0] / proxy, origin[1] / proxy)
+        if stage_prefix:
+            self.quality_governor.add_render_time((time.perf_counter() - start) * 1000)
+
+        # Apply transparency
+        return self.opacity_cache.apply(raster, snapshot.image_transparency_level, image_state.name), origin
+
+    def on_render_done(self, image_state, generation, stage_prefix, output_key, result):
+        """
+        Receives a finished raster from the render worker on the Tk thread.
+        Results older than the one already shown are dropped.
+        """
+        if image_state.pending_render_key == (stage_prefix, output_key):
+            image_state.pending_render_key = None
+        if result is None:
+            return
+        if generation <= image_state.shown_generation:
+            logging.debug(f"Dropped stale render of image '{image_state.name}'.")
+            return
+        image_state.shown_generation = generation
+
+        image_state.display_raster, image_state.display_origin = self.store_output(
+            image_state, stage_prefix, output_key, result
+        )
+        self.redraw_scheduler.request()
+
+    def store_output(self, image_state, stage_prefix, output_key, result):
+        """
+        Caches a finished raster: full quality ones in the image's RasterCache,
+        drafts only as the last draft output.
+        """
+        if stage_prefix:
+            return image_state.render_cache.put(stage_prefix + 'output', output_key, result)
+        return image_state.raster_cache.put(output_key, result)
+
+    def get_source_image(self, image_state, scale, draft=False):
+        """
+        Returns (raster, source_scale): the raster to transform for the given
+        scale, and its size relative to image_original. Zoomed-in SVG
+        images are re-rasterized at a cached scale bucket, buckets beyond
+        MAX_SIDE as an SvgTileSource; drafts only use a whole bucket raster
+        that is already cached. Zoomed-out images start from the nearest mipmap level at or
+        above the scale.
+        """
+        svg_rasters = image_state.svg_rasters
+        if svg_rasters is not None:
+            bucket = svg_rasters.get_bucket(scale)
+            if bucket > 1.0:
+                if draft:
+                    raster = svg_rasters.peek(bucket)
+                    if raster is not None:
+                        return raster, bucket
+                else:
+                    try:
+                        if svg_rasters.is_tiled(bucket):
+                            return SvgTileSource(svg_rasters, bucket), bucket
+                        return svg_rasters.get(bucket), bucket
+                    except Exception as e:
+                        logging.error(f"Error rasterizing SVG for image '{image_state.name}': {e}")
+        return image_state.mipmaps.get_level(scale)
 
     ##########################################################################################################
     ###                          --- Mouse and Keyboard Event Handlers ---                                  ###
@@ -898,8 +3541,7 @@ class ImageOverlayApp:
             dy = event.y_root - self.start_y
 
             if event.state & 0x0004:  # If Ctrl key is held down
-                active_image.angle += dx * 0.1  # Reduced rotation sensitivity
-                active_image.angle %= 360  # Keep angle within 0-360 degrees
+                self.transform_engine.rotate(active_image, dx * 0.1)  # Reduced rotation sensitivity
                 logging.debug(f"Rotating image '{active_image.name}' by {dx * 0.1} degrees.")
             else:
                 active_image.offset_x += dx
@@ -908,57 +3550,41 @@ class ImageOverlayApp:
 
             self.start_x = event.x_root
             self.start_y = event.y_root
-            self.draw_images()
+            self.request_redraw()
 
     def on_canvas_click(self, event):
         """
         Handles the event when the canvas is clicked.
         """
         active_image = self.get_active_image()
+        # Canvas coordinates are screen coordinates, also when the window is shrunk
+        x, y = self.canvas.canvasx(event.x), self.canvas.canvasy(event.y)
         if active_image and self.is_rotation_point_mode:
             # Set the rotation point
-            active_image.rotation_point = (event.x, event.y)
+            active_image.rotation_point = (x, y)
             self.is_rotation_point_mode = False
             self.btn_set_rotation_point.config(text="Rot Pt")
-            self.draw_images()
-            logging.info(f"Rotation point set for image '{active_image.name}' at ({event.x}, {event.y}).")
+            self.redraw_scheduler.request()
+            logging.info(f"Rotation point set for image '{active_image.name}' at ({x}, {y}).")
         elif active_image:
-            # Check if click is outside the active image bounds
-            img = active_image.image_original.copy()
-
-            # Apply current transformations to get the actual displayed image size
-            img = img.resize(
-                (int(img.width * active_image.scale), int(img.height * active_image.scale)),
-                Image.LANCZOS
-            )
-
-            if active_image.is_flipped_horizontally:
-                img = img.transpose(Image.FLIP_LEFT_RIGHT)
-            if active_image.is_flipped_vertically:
-                img = img.transpose(Image.FLIP_TOP_BOTTOM)
-
-            # Calculate image position
-            img_width, img_height = img.size
-            x_min = active_image.offset_x - img_width / 2
-            y_min = active_image.offset_y - img_height / 2
-            x_max = active_image.offset_x + img_width / 2
-            y_max = active_image.offset_y + img_height / 2
-
-            # If rotation is applied, the bounding box might be larger
-            # For simplicity, we'll use the axis-aligned bounding box
-            if not (x_min <= event.x <= x_max and y_min <= event.y <= y_max):
+            # Check if click is outside the active image, taking rotation into account
+            if not self.hit_tester.hit_test(active_image, (x, y)):
                 self.toggle_control_mode(False)
                 logging.info("Clicked outside the active image. Control mode disabled.")
 
     def on_mouse_wheel(self, event):
         """
-        Handles the mouse wheel event for zooming.
+        Handles the mouse wheel event for zooming, or for opacity while Shift is held.
         """
         active_image = self.get_active_image()
         if not active_image:
             return
 
         delta = self.get_mouse_wheel_delta(event)
+        if event.state & 0x0001:  # If Shift key is held down
+            self.adjust_transparency(delta * 0.05)
+            return
+
         old_scale = active_image.scale
         active_image.scale_log += delta * 0.05  # Reduce sensitivity
         active_image.scale = pow(2, active_image.scale_log)
@@ -969,7 +3595,7 @@ class ImageOverlayApp:
 
         logging.debug(f"Zooming image '{active_image.name}' to scale {active_image.scale}.")
 
-        self.draw_images()
+        self.request_redraw()
 
     def get_mouse_wheel_delta(self, event):
         """
@@ -997,8 +3623,9 @@ class ImageOverlayApp:
         active_image.angle = 0
         active_image.scale = 1.0
         active_image.scale_log = 0
-        active_image.offset_x = self.canvas.winfo_width() / 2
-        active_image.offset_y = self.canvas.winfo_height() / 2
+        viewport_width, viewport_height = self.get_viewport_size()
+        active_image.offset_x = viewport_width / 2
+        active_image.offset_y = viewport_height / 2
 
         # Reset transparency
         active_image.image_transparency_level = 1.0
@@ -1013,7 +3640,7 @@ class ImageOverlayApp:
         self.is_rotation_point_mode = False
         self.btn_set_rotation_point.config(text="Rot Pt")
 
-        self.draw_images()
+        self.redraw_scheduler.request()
 
         logging.info(f"Reset transformations for image '{active_image.name}'.")
 
@@ -1055,7 +3682,7 @@ class ImageOverlayApp:
         active_image.scale = max(0.1, min(active_image.scale + amount, 10.0))
         active_image.scale_log = math.log2(active_image.scale)
         logging.info(f"Adjusted zoom for image '{active_image.name}' to scale {active_image.scale}.")
-        self.draw_images()
+        self.request_redraw()
 
     def flip_image_horizontal(self):
         """
@@ -1066,7 +3693,7 @@ class ImageOverlayApp:
             return
         active_image.is_flipped_horizontally = not active_image.is_flipped_horizontally
         logging.info(f"Image '{active_image.name}' flipped horizontally.")
-        self.draw_images()
+        self.redraw_scheduler.request()
 
     def flip_image_vertical(self):
         """
@@ -1077,7 +3704,7 @@ class ImageOverlayApp:
             return
         active_image.is_flipped_vertically = not active_image.is_flipped_vertically
         logging.info(f"Image '{active_image.name}' flipped vertically.")
-        self.draw_images()
+        self.redraw_scheduler.request()
 
     def toggle_rotation_point_mode(self):
         """
@@ -1095,7 +3722,7 @@ class ImageOverlayApp:
             self.btn_set_rotation_point.config(text="Rot Pt")
             active_image.rotation_point = None
             logging.info("Rotation point mode disabled and rotation point reset.")
-            self.draw_images()
+            self.redraw_scheduler.request()
 
     def fine_rotate_clockwise(self):
         """
@@ -1116,9 +3743,9 @@ class ImageOverlayApp:
         active_image = self.get_active_image()
         if not active_image:
             return
-        active_image.angle = (active_image.angle + angle_increment) % 360
+        self.transform_engine.rotate(active_image, angle_increment)
         logging.info(f"Rotated image '{active_image.name}' by {angle_increment} degrees.")
-        self.draw_images()
+        self.request_redraw()
 
     ##########################################################################################################
     ###                          --- Control Mode Management ---                                            ###
@@ -1277,7 +3904,7 @@ class ImageOverlayApp:
 
         logging.info(f"Moved image '{active_image.name}' {direction} by {move_amount} pixels.")
 
-        self.draw_images()
+        self.request_redraw()
 
     ##########################################################################################################
     ###                          --- Full Control Mode Methods ---                                          ###
@@ -1672,6 +4299,11 @@ class ImageOverlayApp:
         # Stop global hotkey listener
         if hasattr(self, 'global_hotkey_listener'):
             self.global_hotkey_listener.stop()
+        # Stop the render worker
+        if self.render_worker is not None:
+            self.render_worker.stop()
+        if self.process_renderer is not None:
+            self.process_renderer.stop()
         self.root.destroy()
         sys.exit(0)
 
@@ -1719,7 +4351,7 @@ class ImageOverlayApp:
         self.update_transparency_button()
         logging.info(f"Active image changed to '{value}'.")
 
-        self.draw_images()  # Redraw images to reflect visibility changes
+        self.redraw_scheduler.request()  # Redraw images to reflect visibility changes
         self.toggle_control_mode(True)  # Activate control mode
 
     def apply_transformations_to_svg(self, image_state):
@@ -1791,30 +4423,11 @@ class ImageOverlayApp:
         Applies transformations to the image and returns the transformed image.
         """
         try:
-            img = image_state.image_original.copy()
-
-            # Apply flips
-            if image_state.is_flipped_horizontally:
-                img = img.transpose(Image.FLIP_LEFT_RIGHT)
-            if image_state.is_flipped_vertically:
-                img = img.transpose(Image.FLIP_TOP_BOTTOM)
-
-            # Resize
-            img = img.resize(
-                (int(img.width * image_state.scale), int(img.height * image_state.scale)),
-                Image.LANCZOS
-            )
-
-            # Rotate
-            img = img.rotate(-image_state.angle, expand=True)
+            # Scale, flip and rotate the same way draw_image does
+            img, _ = self.transform_engine.render(image_state.image_original, image_state)
 
             # Adjust transparency
-            if image_state.image_transparency_level < 1.0:
-                alpha = img.getchannel('A')
-                alpha = alpha.point(lambda p: int(p * image_state.image_transparency_level))
-                img.putalpha(alpha)
-
-            return img
+            return self.opacity_cache.apply(img, image_state.image_transparency_level, image_state.name)
 
         except Exception as e:
             logging.error(f"Error getting transformed image: {e}")
@@ -1847,6 +4460,7 @@ class ImageOverlayApp:
         if self.image_window_visible:
             self.image_window.withdraw()
             self.image_window_visible = False
+            self.redraw_scheduler.suspend()
             self.btn_hide_show_image.config(text="Show")
             logging.info("Image window hidden.")
         else:
@@ -1855,13 +4469,18 @@ class ImageOverlayApp:
             self.btn_hide_show_image.config(text="Hide")
             logging.info("Image window shown.")
             self.image_window.update_idletasks()
-            self.draw_images()
+
+            # Render the single frame that was put off while hidden
+            self.redraw_scheduler.dirty = True
+            self.redraw_scheduler.resume()
 
 ##########################################################################################################
 ###                                             --- Run ---                                            ###
 ##########################################################################################################
 
 if __name__ == "__main__":
+    # Render worker processes of a frozen build start through this entry point
+    multiprocessing.freeze_support()
     root = tk.Tk()
     app = ImageOverlayApp(root)
     root.mainloop()